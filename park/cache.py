@@ -0,0 +1,228 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" LRU caches with expiring entries, in memory or saved in a storage. """
+
+# Standard library
+from collections import OrderedDict
+import threading
+import time
+
+
+class Cache(object):
+    """ A thread-safe LRU cache, whose entries expire after a TTL.
+
+    Expired entries are not returned by :meth:`get`, but are kept (until
+    they are evicted) so that they can be revalidated, see :meth:`peek`.
+
+    """
+
+    def __init__(self, size=1024, ttl=None, clock=time.time):
+        self.size = size
+        self.ttl = ttl
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries and not self._expired(key)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __repr__(self):
+        return '<%s: %d/%d entries, %d hits, %d misses>' % (
+            self.__class__.__name__, len(self), self.size, self.hits,
+            self.misses
+        )
+
+    #### 'Cache' protocol #####################################################
+
+    def delete(self, key):
+        """ Delete the entry of the key, if there is one. """
+
+        with self._lock:
+            if self._entries.pop(key, None) is not None:
+                self._deleted(key)
+
+        return
+
+    def get(self, key, default=None):
+        """ Return the value of the key, if it hasn't expired. """
+
+        with self._lock:
+            if key not in self._entries or self._expired(key):
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            self._entries[key] = entry = self._entries.pop(key)
+
+        return entry[1]
+
+    def peek(self, key, default=None):
+        """ Return the value of the key, even if it expired. """
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+        return default if entry is None else entry[1]
+
+    def set(self, key, value, ttl=None):
+        """ Set the value of the key, to expire after ttl (or the default).
+
+        """
+
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else self.clock() + ttl
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (expires, value)
+            self._saved(key, expires, value)
+
+            while len(self._entries) > self.size:
+                evicted, _ = self._entries.popitem(last=False)
+                self.evictions += 1
+                self._deleted(evicted)
+
+        return
+
+    @property
+    def stats(self):
+        """ The hit, miss and eviction counts, and the size of the cache. """
+
+        return {
+            'entries': len(self),
+            'size': self.size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+        }
+
+    #### Private protocol #####################################################
+
+    def _deleted(self, key):
+        """ Called when an entry is deleted or evicted. """
+
+        return
+
+    def _expired(self, key):
+        expires = self._entries[key][0]
+
+        return expires is not None and expires <= self.clock()
+
+    def _saved(self, key, expires, value):
+        """ Called when an entry is set. """
+
+        return
+
+
+class StorageCache(Cache):
+    """ A cache whose entries are also saved in a storage namespace.
+
+    The entries are loaded when the cache is created.  Changes are written
+    to the :class:`park.storage.Storage` together, in one transaction, at
+    most ``delay`` seconds after they are made (or right away, if ``delay``
+    is 0), and not while holding the lock of the cache.
+
+    """
+
+    def __init__(self, storage, namespace, size=1024, ttl=None,
+                 clock=time.time, delay=0):
+        super(StorageCache, self).__init__(size, ttl, clock)
+        self.storage = storage
+        self.namespace = namespace
+        self.delay = delay
+        self.writes = 0
+
+        self._changes = {}
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+        # Without the order of use, entries expiring earlier are older.
+        records = sorted(
+            storage.items(namespace), key=lambda item: item[1]['expires']
+        )
+        for key, record in records[-size:]:
+            self._entries[key] = (record['expires'], record['value'])
+        with storage.transaction():
+            for key, record in records[:-size]:
+                storage.delete(namespace, key)
+
+    #### 'Cache' protocol #####################################################
+
+    def delete(self, key):
+        super(StorageCache, self).delete(key)
+        if self.delay <= 0:
+            self.flush()
+
+        return
+
+    def set(self, key, value, ttl=None):
+        super(StorageCache, self).set(key, value, ttl)
+        if self.delay <= 0:
+            self.flush()
+
+        return
+
+    #### 'StorageCache' protocol ##############################################
+
+    def flush(self):
+        """ Write the changes made since the last write, if any. """
+
+        with self._flush_lock:
+            with self._lock:
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+                changes, self._changes = self._changes, {}
+
+            if len(changes) == 0:
+                return
+
+            with self.storage.transaction():
+                for key, record in changes.iteritems():
+                    if record is None:
+                        self.storage.delete(self.namespace, key)
+                    else:
+                        self.storage.set(self.namespace, key, record)
+            self.writes += 1
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _changed(self, key, record):
+        """ Save a change to be written out; called with the lock held. """
+
+        self._changes[key] = record
+
+        if self.delay <= 0:
+            # Written once the lock is released, see set and delete.
+            return
+
+        if self._timer is None:
+            self._timer = threading.Timer(self.delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+        return
+
+    def _deleted(self, key):
+        self._changed(key, None)
+
+        return
+
+    def _saved(self, key, expires, value):
+        self._changed(key, {'expires': expires, 'value': value})
+
+        return
+
+#### EOF ######################################################################
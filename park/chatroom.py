@@ -55,13 +55,73 @@ import xmpp
 
 # Project library
 from park import serialize
+from park.executor import HookExecutor
+from park.fanout import FanOut
+from park.journal import Journal
+from park.membership import INVITED, SUBSCRIBED, Membership
+from park.message_queue import DROP_LOW_PRIORITY, LOW, MessageQueue
 from park.plugin import load_file, wrap_as_bot_command
-from park.text_processing import chunk_text, highlight_word
+from park.ratelimit import RateLimiter
+from park.scheduler import Scheduler
+from park.storage import JSON, open_storage
+from park.text_processing import chunk_text
 from park.util import (
-    captured_stdout, get_code_from_url, google, install_log_handler, is_url,
-    requires_invite, requires_subscription
+    captured_stdout, get_code_from_url, get_mail_spool, google,
+    install_log_handler, is_url, requires_invite, requires_subscription
 )
 
+try:
+    from park.settings import FANOUT_WORKERS
+except ImportError:
+    FANOUT_WORKERS = 2
+
+try:
+    from park.settings import MESSAGE_QUEUE_SIZE, MESSAGE_QUEUE_POLICY
+except ImportError:
+    MESSAGE_QUEUE_SIZE, MESSAGE_QUEUE_POLICY = 1000, DROP_LOW_PRIORITY
+
+# Google allows 50 stanzas in 12.5 seconds; stay a little below that.
+try:
+    from park.settings import RATE_LIMIT, RATE_LIMIT_PER_USER
+except ImportError:
+    RATE_LIMIT, RATE_LIMIT_PER_USER = (45, 12.5), None
+
+# Number of threads for each hook, and overrides for particular hooks, like
+# {'urls.message_processor': 4}
+try:
+    from park.settings import HOOK_POOL_SIZE, HOOK_POOL_SIZES
+except ImportError:
+    HOOK_POOL_SIZE, HOOK_POOL_SIZES = 2, {}
+
+# Seconds between saves of the state, and between keep-alive messages
+try:
+    from park.settings import STATE_FLUSH_INTERVAL
+except ImportError:
+    STATE_FLUSH_INTERVAL = 60
+
+KEEP_ALIVE_INTERVAL = 300
+
+# Storage backend for the state and plugin data, 'json' or 'sqlite'
+try:
+    from park.settings import STORAGE_BACKEND
+except ImportError:
+    STORAGE_BACKEND = JSON
+
+# Changes to the state are written out at most these many seconds later
+try:
+    from park.settings import STATE_SAVE_DELAY
+except ImportError:
+    STATE_SAVE_DELAY = 5
+
+# Seconds between compactions of the journal of changes into the state file
+try:
+    from park.settings import JOURNAL_COMPACT_INTERVAL
+except ImportError:
+    JOURNAL_COMPACT_INTERVAL = 60 * 60
+
+# Default interval (in seconds, or an alias like '@daily') for idle hooks
+IDLE_INTERVAL = 300
+
 HERE = dirname(abspath(__file__))
 LOG_FILE_NAME = join(HERE, 'park.log')
 
@@ -91,23 +151,52 @@ class ChatRoomJabberBot(JabberBot):
         self.server = server
         self.lock = threading.RLock()
 
+        # Broadcasts are sent out in separate threads, except when debugging
+        self.fanout = FanOut(
+            self.send, workers=FANOUT_WORKERS, log=self.log,
+            threaded=not debug
+        )
+        self.rate_limiter = RateLimiter(
+            RATE_LIMIT, RATE_LIMIT_PER_USER, log=self.log
+        )
+
+        # State changes are written right away, when debugging
+        self.storage = open_storage(STORAGE_BACKEND, self.root, self.log)
+        self.state_store = serialize.StateStore(
+            self.storage, delay=0 if debug else STATE_SAVE_DELAY, log=self.log
+        )
+        self.journal = Journal(join(self.root, 'journal.jsonl'), self.log)
         self._state = self.read_state()
+        self._replay_journal(self._state)
 
-        self.users = self._state.get('users', dict())
-        self.invited = self._state.get('invited', dict())
+        self.members = Membership(
+            users=self._state.get('users', dict()),
+            invited=self._state.get('invited', dict())
+        )
+        self.members.add_listener(self._members_changed)
+        self._nicks_changed()
         self.storytellers = self._state.get('storytellers', dict())
         self.ideas = self._state.get('ideas', [])
         self.topic = self._state.get('topic', '')
         self.gist_urls = self._state.get('gist_urls', [])
         self._protected = [',add', ',restart']
         self.started = time.time()
-        self.message_queue = []
-        self.thread_killed = False
+        self.message_queue = MessageQueue(
+            MESSAGE_QUEUE_SIZE, MESSAGE_QUEUE_POLICY
+        )
 
         # Plugins
+        self.hook_executor = HookExecutor(
+            HOOK_POOL_SIZE, HOOK_POOL_SIZES, log=self.log
+        )
+        self.scheduler = Scheduler(self.hook_executor, log=self.log)
+        self.scheduler.add(self._keep_alive, KEEP_ALIVE_INTERVAL)
+        self.scheduler.add(self.save_state, STATE_FLUSH_INTERVAL, jitter=0)
+        self.scheduler.add(self._compact_journal, JOURNAL_COMPACT_INTERVAL)
+        self.thread_killed = False
         self._command_plugins = []
-        self._idle_hooks = []
         self._message_processors = []
+        self._presence_processors = []
 
         # Fetch all code from the gist urls and make commands
         self._add_gist_commands()
@@ -123,6 +212,26 @@ class ChatRoomJabberBot(JabberBot):
 
         return join(self.root, 'state.json')
 
+    @property
+    def invited(self):
+        """ The invited users, as a dict of email -> nick. """
+
+        return self.members.invited
+
+    @invited.setter
+    def invited(self, invited):
+        self.members.reset(INVITED, invited)
+
+    @property
+    def users(self):
+        """ The subscribed users, as a dict of email -> nick. """
+
+        return self.members.users
+
+    @users.setter
+    def users(self, users):
+        self.members.reset(SUBSCRIBED, users)
+
     #### JabberBot interface ##################################################
 
     def callback_message(self, conn, mess):
@@ -137,7 +246,7 @@ class ChatRoomJabberBot(JabberBot):
         text = mess.getBody()
         username = self.get_sender_username(mess)
 
-        if username not in self.users.keys() + self.invited.keys():
+        if username not in self.members:
             self.log.info(
                 'Ignored %s type message - %s - from %s',
                 mess.getType(), text, username
@@ -239,6 +348,40 @@ class ChatRoomJabberBot(JabberBot):
 
         return self.conn
 
+    def send_message(self, mess):
+        """ Send an XMPP message, paced to stay within the server limits.
+
+        Messages are queued for a pacer thread, except when debugging.
+
+        """
+
+        user = mess.getTo().getStripped()
+        send_message = super(ChatRoomJabberBot, self).send_message
+
+        if self.debug:
+            self.rate_limiter.wait(user)
+            send_message(mess)
+
+        else:
+            self.rate_limiter.submit(user, send_message, mess)
+
+        return
+
+    def status_type_changed(self, jid, new_status_type):
+        """ Call the presence processors, when a member's status changes. """
+
+        super(ChatRoomJabberBot, self).status_type_changed(
+            jid, new_status_type
+        )
+
+        username = '%s@%s' % (jid.getNode(), jid.getDomain())
+        if username in self.members:
+            self._run_hooks(
+                self._presence_processors, username, new_status_type
+            )
+
+        return
+
     def get_email_from_nick(self, nick):
         """ Return the email of the user with the given nick.
 
@@ -246,13 +389,7 @@ class ChatRoomJabberBot(JabberBot):
 
         """
 
-        for email, alias in self.users.iteritems():
-            if nick == alias:
-                break
-        else:
-            email = None
-
-        return email
+        return self.members.get_email(nick)
 
     def get_sender_nick(self, mess):
         """ Get the nick of the user from a message. """
@@ -272,87 +409,81 @@ class ChatRoomJabberBot(JabberBot):
         )
 
     def idle_proc(self):
+        """ Hand over the queued messages to be fanned out to all users.
+
+        Called from the receive loop, and never waits on the delivery.
+
+        """
 
         if len(self.message_queue) == 0:
             return
 
-        # copy the message queue, then empty it
-        queue = self.message_queue
-        self.message_queue = []
+        queue = self.message_queue.drain()
 
         messages = []
 
         for message in queue:
             messages.extend(chunk_text(message))
 
-        for message in messages:
-            if len(self.users):
+        if len(self.users):
+            for message in messages:
                 self.log.info(
                     'sending "%s" to %d user(s).', message, len(self.users)
                 )
 
-            for user in self.users:
-                if not message.startswith("[%s]:" % self.users[user]):
-                    self.send(user, highlight_word(message, self.users[user]))
+        self.fanout.broadcast(messages, dict(self.users))
 
         return
 
     def read_state(self):
-        """ Reads the persisted state. """
+        """ Reads the persisted state, including any unsaved changes. """
 
-        self.lock.acquire()
-        data = serialize.read_state(self.db)
-        self.lock.release()
-
-        return data
+        return self.state_store.read()
 
     def thread_proc(self):
-        while not self.thread_killed:
+        """ Run the idle hooks and other periodic jobs, until killed. """
 
-            # fixme: do we need this?
-            self.message_queue.append('')
+        # fixme: prints in idle hooks are not captured as messages.
+        # this may be good?
+        self.scheduler.run()
 
-            # fixme: prints in idle hooks are not captured as messages.
-            # this may be good?
-            for hook in self._idle_hooks:
-                try:
-                    thread = self._run_hook_in_thread(hook, self)
-                    thread.join()
-                except Exception as e:
-                    self.message_queue.append(e)
+        return
 
-            self.save_state()
+    @property
+    def thread_killed(self):
+        return self._thread_killed
 
-            for i in range(300):
-                time.sleep(1)
-                if self.thread_killed:
-                    return
+    @thread_killed.setter
+    def thread_killed(self, killed):
+        self._thread_killed = killed
+        if killed:
+            self.scheduler.stop()
 
     def save_state(self, extra_state=None):
-        """ Persists the state of the bot. """
+        """ Persists the state of the bot.
+
+        Only the changed parts of the state cause a write, and writes are
+        coalesced and delayed by up to ``STATE_SAVE_DELAY`` seconds.
+
+        """
 
-        self.lock.acquire()
-        old_state = self.read_state()
         new_state = dict(
-            users=self.users,
-            invited=self.invited,
+            users=self.members.as_dict(SUBSCRIBED),
+            invited=self.members.as_dict(INVITED),
             storytellers=self.storytellers,
             topic=self.topic,
             ideas=self.ideas,
             gist_urls=self.gist_urls
         )
-        old_state.update(new_state)
         if extra_state is not None:
-            old_state.update(extra_state)
-
-        serialize.save_state(self.db, old_state)
+            new_state.update(extra_state)
 
-        self.lock.release()
+        self.state_store.update(new_state)
 
         return
 
     def shutdown(self):
-        self.save_state()
+        self._compact_journal()
 
     #### Bot Commands #########################################################
 
@@ -374,6 +505,8 @@ class ChatRoomJabberBot(JabberBot):
 
         self.shutdown()
         self.idle_proc()
+        self.fanout.flush()
+        self.rate_limiter.flush()
         self.conn.sendPresence(typ='unavailable')
         self._attempt_reconnect()
 
@@ -389,9 +522,10 @@ class ChatRoomJabberBot(JabberBot):
 
         else:
             nick = user.split('@')[0][:self.NICK_LEN]
-            self.users[user] = nick
-            self.invited.pop(user)
-            self.message_queue.append('_%s has joined the channel_' % user)
+            self.members.add(user, nick, SUBSCRIBED)
+            self.message_queue.append(
+                '_%s has joined the channel_' % user, priority=LOW
+            )
             message = '%s, Welcome! Type %s for help.' % (
                 nick, self.help._jabberbot_command_name
             )
@@ -403,8 +537,10 @@ class ChatRoomJabberBot(JabberBot):
     def unsubscribe(self, user, args):
         """ Un-subscribe from the broadcast list. """
 
-        user = self.users.pop(user)
-        self.message_queue.append('_%s has left the channel_' % user)
+        user = self.members.remove(user).nick
+        self.message_queue.append(
+            '_%s has left the channel_' % user, priority=LOW
+        )
 
         return 'You are now un-subscribed.'
 
@@ -413,16 +549,20 @@ class ChatRoomJabberBot(JabberBot):
     def dnd(self, user, args):
         """ Command to toggle do-not-disturb mode. """
 
-        if user in self.users:
-            name = self.users.pop(user)
-            self.invited[user] = name
-            self.message_queue.append('_%s entered NO PARKING ZONE_' % name)
+        name = self.members.get(user).nick
+
+        if self.members.is_subscribed(user):
+            self.members.add(user, name, INVITED)
+            self.message_queue.append(
+                '_%s entered NO PARKING ZONE_' % name, priority=LOW
+            )
             message = 'NO PARKING ZONE entered. Bye!'
 
         else:
-            name = self.invited.pop(user)
-            self.users[user] = name
-            self.message_queue.append('_%s is out of NO PARKING ZONE_' % name)
+            self.members.add(user, name, SUBSCRIBED)
+            self.message_queue.append(
+                '_%s is out of NO PARKING ZONE_' % name, priority=LOW
+            )
             message = 'PARKING ZONE entered. Welcome, %s!' % name
 
         return message
@@ -434,7 +574,7 @@ class ChatRoomJabberBot(JabberBot):
 
         nick = args.strip().replace(' ', '_')
 
-        if nick in self.users.values():
+        if self.members.get_email(nick) is not None:
             message = 'Nick already taken.'
 
         elif len(nick) == 0:
@@ -448,7 +588,7 @@ class ChatRoomJabberBot(JabberBot):
             self.message_queue.append(
                 '_%s is now known as %s_' % (self.users[user], nick)
             )
-            self.users[user] = nick
+            self.members.add(user, nick, SUBSCRIBED)
 
         return message
 
@@ -458,6 +598,7 @@ class ChatRoomJabberBot(JabberBot):
         """ Change the topic/status. """
 
         self.topic = args
+        self.journal.append({'type': 'topic', 'topic': args})
         self._JabberBot__set_status(self.topic)
         self.message_queue.append(
             '_%s changed topic to %s_' % (self.users[user], args)
@@ -516,14 +657,7 @@ class ChatRoomJabberBot(JabberBot):
 
         query = args.strip().replace(' ', '_')
 
-        for email, nick in self.users.iteritems():
-            if nick == query:
-                break
-
-        else:
-            email = 'Nobody!'
-
-        return email
+        return self.members.get_email(query) or 'Nobody!'
 
     @botcmd(name=',uptime')
     @requires_subscription
@@ -727,6 +861,17 @@ class ChatRoomJabberBot(JabberBot):
 
         return
 
+    def _compact_journal(self):
+        """ Save the state, including all the journaled changes, to disk. """
+
+        def save_snapshot():
+            self.save_state()
+            self.state_store.flush()
+
+        self.journal.compact(save_snapshot)
+
+        return
+
     def _get_requirements(self, path):
         """ Read requirements from the file. """
 
@@ -755,6 +900,14 @@ class ChatRoomJabberBot(JabberBot):
         else:
             self.log.debug('Failed to "pip install %s"' % requirement)
 
+    def _keep_alive(self):
+        """ Queue an empty message, to keep the connection alive. """
+
+        # fixme: do we need this?
+        self.message_queue.append('', priority=LOW)
+
+        return
+
     def _load_plugin_from_path(self, path):
         """ Load the plugin at the given path. """
 
@@ -764,11 +917,19 @@ class ChatRoomJabberBot(JabberBot):
             self._add_command_from_plugin(plugin)
 
         if getattr(plugin, 'idle_hook', None) is not None:
-            self._idle_hooks.append(plugin.idle_hook)
+            self.scheduler.add(
+                plugin.idle_hook,
+                getattr(plugin, 'IDLE_INTERVAL', IDLE_INTERVAL),
+                args=(self,),
+                jitter=getattr(plugin, 'IDLE_JITTER', 0.1),
+            )
 
         if getattr(plugin, 'message_processor', None) is not None:
             self._message_processors.append(plugin.message_processor)
 
+        if getattr(plugin, 'presence_processor', None) is not None:
+            self._presence_processors.append(plugin.presence_processor)
+
         return
 
     def _load_plugins(self):
@@ -785,40 +946,75 @@ class ChatRoomJabberBot(JabberBot):
 
         return
 
+    def _members_changed(self, changes):
+        """ Called with the list of changes, when the members change. """
+
+        for email, nick, state in changes:
+            self.journal.append(
+                dict(type='member', email=email, nick=nick, state=state)
+            )
+
+        self._nicks_changed()
+
+        return
+
+    def _nicks_changed(self):
+        """ Rebuild the index of nicks used to highlight broadcasts. """
+
+        self.fanout.highlighter.update(self.users.values())
+
+        return
+
     def _process_message_via_hooks(self, username, text):
         """ Call the message processors on the text. """
         # fixme: how do we handle hooks that modify the text?
-        def capture_output_from_hooks():
-            with captured_stdout() as captured:
-                threads = [
-                    self._run_hook_in_thread(hook, self, username, text)
+        self._run_hooks(self._message_processors, username, text)
+
+        return
+
+    def _replay_journal(self, state):
+        """ Apply the changes in the journal to the given (saved) state. """
 
-                    for hook in self._message_processors
-                ]
-                [thread.join() for thread in threads]
+        sections = {SUBSCRIBED: 'users', INVITED: 'invited'}
 
-            self.message_queue.extend(captured.output.splitlines())
+        for record in self.journal.read():
+            if record.get('type') == 'member':
+                email = record['email']
+                for section in sections.values():
+                    state.setdefault(section, {}).pop(email, None)
+                if record['state'] is not None:
+                    state[sections[record['state']]][email] = record['nick']
 
-        # fixme: probably should be self.no_threading?
-        # or may be capturing stdout isn't the best thing to do?
-        # or in console mode, captured_stdout does different things?
-        # the problem is captured_stdout, really! not threading.
+            elif record.get('type') == 'topic':
+                state['topic'] = record['topic']
+
+        return
+
+    def _run_hooks(self, hooks, *args):
+        """ Run the hooks in their pools, with the given arguments. """
+
+        jobs = [
+            self.hook_executor.submit_in(
+                hook, self._run_hook_captured, hook, *args
+            )
+            for hook in hooks
+        ]
+
+        # Wait for the hooks when debugging, to make testing easier.
         if self.debug:
-            capture_output_from_hooks()
+            [job.wait() for job in jobs]
 
-        else:
-            thread = threading.Thread(target=capture_output_from_hooks)
-            thread.daemon = True
-            thread.start()
+        return
 
-    def _run_hook_in_thread(self, hook, *args, **kwargs):
-        """ Run the given hook in a new thread. """
+    def _run_hook_captured(self, hook, *args):
+        """ Run the given hook, and queue anything it prints as messages. """
 
-        thread = threading.Thread(target=hook, args=args, kwargs=kwargs)
-        thread.daemon = True
-        thread.start()
+        with captured_stdout(local=True) as captured:
+            hook(self, *args)
 
-        return thread
+        self.message_queue.extend(captured.output.splitlines())
+
+        return
 
     def _save_code_to_plugin(self, name, code):
         """ Save the given code as a plugin file. """
@@ -872,6 +1068,9 @@ def main():
 
     bc = ChatRoomJabberBot(USERNAME, PASSWORD, SERVER, RES, debug=debug)
 
+    # Send any emails that were queued before the last restart
+    get_mail_spool()
+
     th = threading.Thread(target=bc.thread_proc)
     bc.serve_forever(connect_callback=lambda: th.start())
     bc.thread_killed = True
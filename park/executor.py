@@ -0,0 +1,183 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Pools of long-lived worker threads, to run hooks and other jobs. """
+
+# Standard library
+import logging
+from Queue import Queue
+import threading
+
+
+class Job(object):
+    """ A function call submitted to a pool. """
+
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.exception = None
+        self._done = threading.Event()
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def run(self):
+        """ Run the function, and save its result or exception. """
+
+        try:
+            self.result = self.function(*self.args, **self.kwargs)
+
+        except Exception as e:
+            self.exception = e
+            raise
+
+        finally:
+            self._done.set()
+
+    def wait(self, timeout=None):
+        """ Wait for the job to finish; returns True if it is done. """
+
+        return self._done.wait(timeout)
+
+
+class WorkerPool(object):
+    """ A fixed number of daemon threads working off a queue of jobs.
+
+    The threads are started when the first job is submitted.
+
+    """
+
+    def __init__(self, size=1, name='pool', log=None):
+        self.log = log if log is not None else logging.getLogger(__name__)
+        self.name = name
+        self.size = max(1, size)
+
+        self._queue = Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<WorkerPool %s: %d thread(s), %d queued>' % (
+            self.name, self.size, self.depth
+        )
+
+    #### 'WorkerPool' protocol ################################################
+
+    @property
+    def depth(self):
+        """ The number of jobs waiting to be picked up. """
+
+        return self._queue.qsize()
+
+    def join(self):
+        """ Block until all the submitted jobs are done. """
+
+        self._queue.join()
+
+        return
+
+    def submit(self, function, *args, **kwargs):
+        """ Submit a function call to the pool, and return the Job. """
+
+        self._start()
+        job = Job(function, args, kwargs)
+        self._queue.put(job)
+
+        return job
+
+    #### Private protocol #####################################################
+
+    def _start(self):
+        if len(self._threads) == self.size:
+            return
+
+        with self._lock:
+            while len(self._threads) < self.size:
+                name = '%s-%d' % (self.name, len(self._threads))
+                thread = threading.Thread(target=self._work, name=name)
+                thread.daemon = True
+                thread.start()
+                self._threads.append(thread)
+
+        return
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                job.run()
+
+            except Exception:
+                self.log.exception('Error running %s', self.name)
+
+            finally:
+                self._queue.task_done()
+
+
+class HookExecutor(object):
+    """ Runs hooks in worker pools of their own, one pool per hook.
+
+    ``size`` is the number of threads in the pool of each hook, and
+    ``sizes`` is a dict to override it for particular hooks, by name.  The
+    name of a hook is ``<plugin>.<function>``, like
+    ``urls.message_processor``.
+
+    """
+
+    def __init__(self, size=2, sizes=None, log=None):
+        self.log = log if log is not None else logging.getLogger(__name__)
+        self.size = size
+        self.sizes = sizes if sizes is not None else {}
+
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<HookExecutor: %d pool(s), %d queued>' % (
+            len(self._pools), sum(self.depth.values())
+        )
+
+    #### 'HookExecutor' protocol ##############################################
+
+    @property
+    def depth(self):
+        """ The number of jobs waiting to be picked up, for each hook. """
+
+        return dict(
+            (name, pool.depth) for name, pool in self._pools.items()
+        )
+
+    def submit(self, hook, *args, **kwargs):
+        """ Submit a call of the hook to its pool, and return the Job. """
+
+        return self.submit_in(hook, hook, *args, **kwargs)
+
+    def submit_in(self, hook, function, *args, **kwargs):
+        """ Submit a call of the function to the pool of the given hook. """
+
+        return self._get_pool(hook).submit(function, *args, **kwargs)
+
+    #### Private protocol #####################################################
+
+    def _get_pool(self, hook):
+        name = hook_name(hook)
+
+        with self._lock:
+            pool = self._pools.get(name)
+            if pool is None:
+                size = self.sizes.get(name, self.size)
+                pool = self._pools[name] = WorkerPool(size, name, self.log)
+
+        return pool
+
+
+def hook_name(hook):
+    """ Return the name of a hook, as <plugin>.<function>. """
+
+    return '%s.%s' % (hook.__module__, hook.__name__)
+
+#### EOF ######################################################################
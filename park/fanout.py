@@ -0,0 +1,244 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Fan-out of broadcast messages to all the users of the chatroom. """
+
+# Standard library
+from collections import deque
+import logging
+from Queue import Queue
+import threading
+import time
+
+# Project library
+from park.text_processing import (
+    NickHighlighter, coalesce_text, highlight_word
+)
+
+
+class FanOut(object):
+    """ Deliver broadcast messages to all the users, off the receive loop.
+
+    A dispatcher thread builds the bodies of a batch of messages for each
+    recipient, and hands the sends over to a pool of sender threads.
+    Consecutive messages to a recipient are packed into as few stanzas as
+    possible.  A recipient is always served by the same sender, so the
+    order of messages is preserved for each recipient.
+
+    If ``threaded`` is False, messages are delivered in the calling thread.
+
+    """
+
+    #: Number of fan-out timings to keep around for the stats.
+    HISTORY = 100
+
+    def __init__(self, send, workers=2, log=None, threaded=True, limit=512):
+        self.log = log if log is not None else logging.getLogger(__name__)
+        self.threaded = threaded
+        self.limit = limit
+        self.workers = max(1, workers)
+        self.timings = deque(maxlen=self.HISTORY)
+        self.highlighter = NickHighlighter()
+
+        self._send = send
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._dispatch_queue = Queue()
+        self._send_queues = [Queue() for _ in range(self.workers)]
+
+    def __repr__(self):
+        stats = self.stats
+        return (
+            '<FanOut: %(count)d broadcast(s), last %(last).3fs, '
+            'avg %(average).3fs, max %(max).3fs>' % stats
+        )
+
+    #### 'FanOut' protocol ####################################################
+
+    def broadcast(self, messages, users):
+        """ Send the messages to the given users, a dict of email -> nick. """
+
+        broadcast = _Broadcast(messages, time.time())
+
+        if not self.threaded:
+            self._dispatch(broadcast, users)
+
+        else:
+            self.start()
+            self._dispatch_queue.put((broadcast, users))
+
+        return
+
+    def flush(self):
+        """ Block until all the messages handed over have been sent. """
+
+        if self._started:
+            self._dispatch_queue.join()
+            for queue in self._send_queues:
+                queue.join()
+
+        return
+
+    def start(self):
+        """ Start the dispatcher and the sender threads, if not running. """
+
+        with self._start_lock:
+            if self._started:
+                return
+
+            targets = [(self._dispatch_loop, ())] + [
+                (self._send_loop, (queue,)) for queue in self._send_queues
+            ]
+            for target, args in targets:
+                thread = threading.Thread(target=target, args=args)
+                thread.daemon = True
+                thread.start()
+
+            self._started = True
+
+        return
+
+    @property
+    def stats(self):
+        """ Stats of the fan-out times of the recent broadcasts. """
+
+        timings = list(self.timings)
+        count = len(timings)
+
+        return {
+            'count': count,
+            'last': timings[-1] if count else 0.0,
+            'average': sum(timings) / count if count else 0.0,
+            'max': max(timings) if count else 0.0,
+        }
+
+    #### Private protocol #####################################################
+
+    def _build(self, messages, users):
+        """ Return a list of (user, body) pairs to be sent for the messages.
+
+        """
+
+        sends = []
+        variants = [
+            self.highlighter.highlight(message) for message in messages
+        ]
+
+        for user, nick in users.iteritems():
+            own = '[%s]:' % nick
+            bodies = []
+
+            for message, variant in zip(messages, variants):
+                if message.startswith(own):
+                    continue
+
+                if nick in self.highlighter:
+                    bodies.append(variant.get(nick, message))
+
+                else:
+                    # The index hasn't caught up with a nick change, yet.
+                    bodies.append(highlight_word(message, nick))
+
+            # Empty (keep-alive) messages are only sent when there's nothing
+            # else to send.
+            bodies = [body for body in bodies if body] or bodies[:1]
+
+            for body in coalesce_text(bodies, self.limit):
+                sends.append((user, body))
+
+        return sends
+
+    def _deliver(self, user, body, broadcast):
+        """ Send a body to a user, and account for it in the broadcast. """
+
+        try:
+            self._send(user, body)
+
+        except Exception:
+            self.log.exception('Failed to send message to %s', user)
+
+        if broadcast.done():
+            self._report(broadcast)
+
+        return
+
+    def _dispatch(self, broadcast, users):
+        """ Build the bodies for all the recipients, and send them. """
+
+        sends = self._build(broadcast.messages, users)
+        broadcast.pending = len(sends)
+
+        if len(sends) == 0:
+            self._report(broadcast)
+
+        for user, body in sends:
+            if self.threaded:
+                queue = self._send_queues[hash(user) % self.workers]
+                queue.put((user, body, broadcast))
+
+            else:
+                self._deliver(user, body, broadcast)
+
+        return
+
+    def _dispatch_loop(self):
+        while True:
+            broadcast, users = self._dispatch_queue.get()
+            try:
+                self._dispatch(broadcast, users)
+
+            except Exception:
+                self.log.exception('Failed to fan-out %r', broadcast.messages)
+
+            finally:
+                self._dispatch_queue.task_done()
+
+    def _report(self, broadcast):
+        """ Record and log the time taken to fan-out a broadcast. """
+
+        elapsed = time.time() - broadcast.created
+        self.timings.append(elapsed)
+        self.log.info(
+            'fanned out %d message(s) as %d stanza(s) in %.3fs',
+            len(broadcast.messages), broadcast.stanzas, elapsed
+        )
+
+        return
+
+    def _send_loop(self, queue):
+        while True:
+            user, body, broadcast = queue.get()
+            try:
+                self._deliver(user, body, broadcast)
+
+            finally:
+                queue.task_done()
+
+
+class _Broadcast(object):
+    """ Book-keeping for a batch of messages being fanned out. """
+
+    def __init__(self, messages, created):
+        self.messages = messages
+        self.created = created
+        self.stanzas = 0
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self):
+        return self._pending
+
+    @pending.setter
+    def pending(self, value):
+        self.stanzas = self._pending = value
+
+    def done(self):
+        """ Mark one send as done, and return True if it was the last one. """
+
+        with self._lock:
+            self._pending -= 1
+            return self._pending == 0
+
+#### EOF ######################################################################
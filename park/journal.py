@@ -0,0 +1,142 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" An append-only journal of changes to the state of the bot. """
+
+# Standard library
+import json
+import logging
+import os
+from os.path import exists
+import threading
+
+
+class Journal(object):
+    """ Changes to the state, appended to a file as one JSON object a line.
+
+    Each record is written and synced to the disk right away, so that
+    changes survive a crash.  A partially written last line, from a crash,
+    is dropped before appending to the file again.  The records are replayed
+    on top of the last snapshot of the state, and dropped when a new
+    snapshot is saved (see :meth:`compact`).
+
+    """
+
+    def __init__(self, path, log=None):
+        self.log = log if log is not None else logging.getLogger(__name__)
+        self.path = path
+        self.appended = 0
+
+        self._file = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<Journal %s: %d record(s) appended>' % (
+            self.path, self.appended
+        )
+
+    #### 'Journal' protocol ###################################################
+
+    def append(self, record):
+        """ Append a record (a dict) to the journal. """
+
+        line = json.dumps(record) + '\n'
+
+        with self._lock:
+            if self._file is None:
+                self._truncate_torn_record()
+                self._file = open(self.path, 'a')
+            self._file.write(line)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self.appended += 1
+
+        return
+
+    def close(self):
+        """ Close the journal file. """
+
+        with self._lock:
+            self._close()
+
+        return
+
+    def compact(self, save_snapshot):
+        """ Save a snapshot of the state, and drop the journaled records.
+
+        ``save_snapshot`` is called with no appends happening, and must
+        durably save the state, including all the journaled changes.
+
+        """
+
+        with self._lock:
+            save_snapshot()
+            self._close()
+            with open(self.path, 'w'):
+                pass
+            self.log.debug(
+                'Compacted journal %s (%d appends)', self.path, self.appended
+            )
+            self.appended = 0
+
+        return
+
+    def read(self):
+        """ Return the list of records in the journal.
+
+        A partially written last line, from a crash, is ignored.
+
+        """
+
+        records = []
+
+        if not exists(self.path):
+            return records
+
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    self.log.warning('Skipping bad record in %s', self.path)
+
+        return records
+
+    #### Private protocol #####################################################
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+        return
+
+    def _truncate_torn_record(self):
+        """ Truncate the file after its last complete line. """
+
+        if not exists(self.path):
+            return
+
+        with open(self.path, 'rb+') as f:
+            f.seek(0, os.SEEK_END)
+            end = size = f.tell()
+
+            while end > 0:
+                start = max(0, end - 4096)
+                f.seek(start)
+                newline = f.read(end - start).rfind('\n')
+                if newline != -1:
+                    end = start + newline + 1
+                    break
+                end = start
+
+            if end < size:
+                self.log.warning(
+                    'Dropping partially written record in %s', self.path
+                )
+                f.truncate(end)
+
+        return
+
+#### EOF ######################################################################
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Delivery of emails over reused SMTP connections. """
+
+# Standard library
+import logging
+import smtplib
+import socket
+import threading
+import time
+
+# Project library
+from park.ratelimit import TokenBucket
+
+
+class MailTransport(object):
+    """ Sends emails over one SMTP connection, reused between messages.
+
+    The connection is opened (with STARTTLS and login, if required) on the
+    first message, and reopened when the server drops it, when it has been
+    idle for ``idle_timeout`` seconds, or after ``per_connection``
+    messages.  Messages are paced to ``limit`` (messages, seconds), if
+    given, to stay within the limits of the server.
+
+    """
+
+    def __init__(self, host, port=0, user=None, password=None,
+                 starttls=True, limit=None, per_connection=100,
+                 idle_timeout=60, log=None):
+        self.log = log if log is not None else logging.getLogger(__name__)
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.per_connection = per_connection
+        self.idle_timeout = idle_timeout
+
+        self.connections = 0
+        self.sent = 0
+
+        self._bucket = TokenBucket(*limit) if limit is not None else None
+        self._smtp = None
+        self._sent_on_connection = 0
+        self._last_used = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<MailTransport %s: %d sent, %d connection(s)>' % (
+            self.host, self.sent, self.connections
+        )
+
+    #### 'MailTransport' protocol #############################################
+
+    def close(self):
+        """ Close the connection, if it is open. """
+
+        with self._lock:
+            self._close()
+
+        return
+
+    def send(self, sender, recipients, message):
+        """ Send the message (a string) to the recipients.
+
+        Returns a dict of the recipients that were refused, like
+        :meth:`smtplib.SMTP.sendmail`.
+
+        """
+
+        if self._bucket is not None:
+            time.sleep(self._bucket.reserve())
+
+        with self._lock:
+            try:
+                refused = self._connect().sendmail(
+                    sender, recipients, message
+                )
+
+            except smtplib.SMTPServerDisconnected:
+                self.log.info('Reconnecting to %s', self.host)
+                self._close()
+                refused = self._connect().sendmail(
+                    sender, recipients, message
+                )
+
+            self.sent += 1
+            self._sent_on_connection += 1
+            self._last_used = time.time()
+
+        return refused
+
+    #### Private protocol #####################################################
+
+    def _close(self):
+        if self._smtp is None:
+            return
+
+        try:
+            self._smtp.quit()
+
+        except (smtplib.SMTPException, socket.error):
+            self._smtp.close()
+
+        self._smtp = None
+
+        return
+
+    def _connect(self):
+        """ Return the open connection, (re)connecting if required. """
+
+        if self._smtp is not None and (
+            self._sent_on_connection >= self.per_connection or
+            time.time() - self._last_used > self.idle_timeout
+        ):
+            self._close()
+
+        if self._smtp is None:
+            smtp = smtplib.SMTP(self.host, self.port)
+            if self.starttls:
+                smtp.ehlo()
+                smtp.starttls()
+                smtp.ehlo()
+            if self.user:
+                smtp.login(self.user, self.password)
+
+            self._smtp = smtp
+            self._sent_on_connection = 0
+            self.connections += 1
+
+        return self._smtp
+
+#### EOF ######################################################################
@@ -0,0 +1,247 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" A registry of the members of the chatroom. """
+
+# Standard library
+import threading
+
+#: Membership states.
+SUBSCRIBED = 'subscribed'
+INVITED = 'invited'
+STATES = (SUBSCRIBED, INVITED)
+
+
+class Member(object):
+    """ A member of the chatroom. """
+
+    __slots__ = ('email', 'nick', 'state')
+
+    def __init__(self, email, nick, state):
+        self.email = email
+        self.nick = nick
+        self.state = state
+
+    def __repr__(self):
+        return '<Member: %s (%s) %s>' % (self.nick, self.email, self.state)
+
+
+class Membership(object):
+    """ A registry of the members of the chatroom, with O(1) lookups.
+
+    Keeps the email -> member and the nick -> emails maps for each
+    membership state.  Nicks need not be unique; a nick shared by members
+    is looked up as the member who got it first.  The members in each state
+    are also available as dicts of email -> nick (:attr:`users` and
+    :attr:`invited`), in the same shape as they are persisted.  Changes made
+    to these dicts go through the registry.
+
+    Listeners added with :meth:`add_listener` are called with a list of
+    (email, nick, state) tuples for each change; state is None for members
+    who were removed.
+
+    """
+
+    def __init__(self, users=None, invited=None):
+        self._lock = threading.RLock()
+        self._members = {}
+        self._nicks = dict((state, {}) for state in STATES)
+        self._views = dict(
+            (state, _StateView(self, state)) for state in STATES
+        )
+        self._listeners = []
+
+        if invited is not None:
+            self.reset(INVITED, invited)
+
+        if users is not None:
+            self.reset(SUBSCRIBED, users)
+
+    def __contains__(self, email):
+        return email in self._members
+
+    def __len__(self):
+        return len(self._members)
+
+    #### 'Membership' protocol ################################################
+
+    def add(self, email, nick, state=SUBSCRIBED):
+        """ Add a member, or update the nick and state of an existing one. """
+
+        with self._lock:
+            self._add(email, nick, state)
+
+        self._notify([(email, nick, state)])
+
+        return
+
+    def add_listener(self, listener):
+        """ Add a function to be called with the changes to the members. """
+
+        self._listeners.append(listener)
+
+        return
+
+    def as_dict(self, state):
+        """ Return a (plain) dict of email -> nick of members in a state. """
+
+        with self._lock:
+            return dict(self._views[state])
+
+    def get(self, email):
+        """ Return the member with the given email, or None. """
+
+        return self._members.get(email)
+
+    def get_email(self, nick, state=SUBSCRIBED):
+        """ Return the email of the member with the nick, or None. """
+
+        emails = self._nicks[state].get(nick)
+
+        return emails[0] if emails else None
+
+    @property
+    def invited(self):
+        """ Invited members, as a dict of email -> nick. """
+
+        return self._views[INVITED]
+
+    def is_subscribed(self, email):
+        """ Return True if the email is of a subscribed member. """
+
+        return email in self._views[SUBSCRIBED]
+
+    def remove(self, email):
+        """ Remove the member with the given email, and return it. """
+
+        with self._lock:
+            member = self._remove(email)
+
+        self._notify([(email, member.nick, None)])
+
+        return member
+
+    def reset(self, state, members):
+        """ Replace all the members in a state with the given email -> nick.
+
+        """
+
+        changes = []
+
+        with self._lock:
+            for email in self._views[state].keys():
+                member = self._remove(email)
+                changes.append((email, member.nick, None))
+
+            for email, nick in members.iteritems():
+                self._add(email, nick, state)
+                changes.append((email, nick, state))
+
+        self._notify(changes)
+
+        return
+
+    @property
+    def users(self):
+        """ Subscribed members, as a dict of email -> nick. """
+
+        return self._views[SUBSCRIBED]
+
+    #### Private protocol #####################################################
+
+    def _add(self, email, nick, state):
+        """ Add a member; must be called with the lock held. """
+
+        if state not in STATES:
+            raise ValueError('Unknown state %s' % state)
+
+        member = self._members.get(email)
+
+        if member is not None:
+            self._unindex(member)
+            member.nick, member.state = nick, state
+
+        else:
+            member = self._members[email] = Member(email, nick, state)
+
+        self._nicks[state].setdefault(nick, []).append(email)
+        dict.__setitem__(self._views[state], email, nick)
+
+        return member
+
+    def _notify(self, changes):
+        for listener in self._listeners:
+            listener(changes)
+
+    def _remove(self, email):
+        """ Remove a member; must be called with the lock held. """
+
+        member = self._members.pop(email)
+        self._unindex(member)
+
+        return member
+
+    def _unindex(self, member):
+        nicks = self._nicks[member.state]
+        emails = nicks.get(member.nick, [])
+        if member.email in emails:
+            emails.remove(member.email)
+            if len(emails) == 0:
+                del nicks[member.nick]
+
+        dict.__delitem__(self._views[member.state], member.email)
+
+        return
+
+
+class _StateView(dict):
+    """ A dict of email -> nick of the members in a state.
+
+    All changes are made through the registry, to keep the indexes in sync.
+
+    """
+
+    def __init__(self, registry, state):
+        super(_StateView, self).__init__()
+        self._registry = registry
+        self._state = state
+
+    def __delitem__(self, email):
+        if email not in self:
+            raise KeyError(email)
+
+        self._registry.remove(email)
+
+    def __setitem__(self, email, nick):
+        self._registry.add(email, nick, self._state)
+
+    def clear(self):
+        self._registry.reset(self._state, {})
+
+    def pop(self, email, *default):
+        if email in self:
+            return self._registry.remove(email).nick
+
+        elif default:
+            return default[0]
+
+        raise KeyError(email)
+
+    def popitem(self):
+        email, nick = dict.popitem(dict(self))
+        self._registry.remove(email)
+
+        return email, nick
+
+    def setdefault(self, email, nick=None):
+        if email not in self:
+            self[email] = nick
+
+        return self[email]
+
+    def update(self, *args, **kwargs):
+        for email, nick in dict(*args, **kwargs).iteritems():
+            self[email] = nick
+
+#### EOF ######################################################################
@@ -0,0 +1,206 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" A bounded, thread-safe queue for the outbound messages of the bot. """
+
+# Standard library
+from collections import deque
+import threading
+import time
+
+#: Policies for when the queue is full.
+BLOCK = 'block'
+DROP_OLDEST = 'drop-oldest'
+DROP_LOW_PRIORITY = 'drop-low-priority'
+POLICIES = (BLOCK, DROP_OLDEST, DROP_LOW_PRIORITY)
+
+#: Priorities of the messages.
+LOW = 0
+NORMAL = 1
+
+
+class MessageQueue(object):
+    """ A bounded, thread-safe queue of messages to be sent to all users.
+
+    Supports the list operations used by the bot and the plugins (append,
+    extend, len, indexing and iteration), and :meth:`drain` to atomically
+    take out all the queued messages.
+
+    When the queue is full, the ``policy`` decides what happens to a new
+    message:
+
+    - ``block``: wait for up to ``timeout`` seconds for some space, and drop
+      the new message if there isn't any, even then.  Only another thread
+      can make space, so the thread that drains the queue never waits, and
+      its new messages are dropped right away.  In the bot, that is the
+      thread that receives messages and runs the commands, so ``block`` only
+      slows down plugins appending from threads of their own.
+
+    - ``drop-oldest``: drop the oldest message in the queue.
+
+    - ``drop-low-priority``: drop the oldest low priority message in the
+      queue, or the new one if it is low priority.  Drop the oldest message
+      if neither of them are low priority.
+
+    """
+
+    #: Window (in seconds) over which the enqueue rate is computed.
+    RATE_WINDOW = 60
+
+    def __init__(self, capacity=1000, policy=DROP_OLDEST, timeout=5):
+        if policy not in POLICIES:
+            raise ValueError('Unknown policy %s' % policy)
+
+        self.capacity = capacity
+        self.policy = policy
+        self.timeout = timeout
+
+        self.enqueued = 0
+        self.dropped = 0
+
+        self._messages = deque()
+        self._drainer = None
+        self._not_full = threading.Condition(threading.Lock())
+        self._enqueue_times = deque()
+
+    def __contains__(self, message):
+        return message in list(self)
+
+    def __getitem__(self, index):
+        with self._not_full:
+            return self._messages[index][1]
+
+    def __iter__(self):
+        with self._not_full:
+            messages = [message for _, message in self._messages]
+
+        return iter(messages)
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __repr__(self):
+        return (
+            '<MessageQueue: depth %(depth)d/%(capacity)d, '
+            '%(rate).2f msg/s, %(dropped)d dropped>' % self.stats
+        )
+
+    #### 'MessageQueue' protocol ##############################################
+
+    def append(self, message, priority=NORMAL):
+        """ Add a message to the queue, making space for it if required. """
+
+        with self._not_full:
+            self._append(message, priority)
+
+        return
+
+    def drain(self):
+        """ Remove and return all the queued messages. """
+
+        with self._not_full:
+            self._drainer = threading.current_thread()
+            messages = [message for _, message in self._messages]
+            self._messages.clear()
+            self._not_full.notify_all()
+
+        return messages
+
+    def extend(self, messages, priority=NORMAL):
+        """ Add all the given messages to the queue, together. """
+
+        with self._not_full:
+            for message in messages:
+                self._append(message, priority)
+
+        return
+
+    @property
+    def rate(self):
+        """ The number of messages enqueued per second, recently. """
+
+        with self._not_full:
+            self._expire_enqueue_times(time.time())
+            count = len(self._enqueue_times)
+
+        return float(count) / self.RATE_WINDOW
+
+    @property
+    def stats(self):
+        """ Counters of the queue. """
+
+        return {
+            'depth': len(self),
+            'capacity': self.capacity,
+            'enqueued': self.enqueued,
+            'dropped': self.dropped,
+            'rate': self.rate,
+        }
+
+    #### Private protocol #####################################################
+
+    def _append(self, message, priority):
+        """ Add a message; must be called with the lock held. """
+
+        if len(self._messages) >= self.capacity and \
+                not self._make_space(priority):
+            return
+
+        self._messages.append((priority, message))
+        self.enqueued += 1
+        self._record_enqueue()
+
+        return
+
+    def _expire_enqueue_times(self, now):
+        while self._enqueue_times and \
+                self._enqueue_times[0] < now - self.RATE_WINDOW:
+            self._enqueue_times.popleft()
+
+    def _make_space(self, priority):
+        """ Make space for a new message of the given priority.
+
+        Must be called with the lock held.  Returns False if the new message
+        should be dropped, instead.
+
+        """
+
+        if self.policy == BLOCK:
+            # Waiting in the thread that drains the queue would never end
+            if threading.current_thread() is self._drainer:
+                self.dropped += 1
+                return False
+
+            deadline = time.time() + self.timeout
+            while len(self._messages) >= self.capacity:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    self.dropped += 1
+                    return False
+                self._not_full.wait(remaining)
+
+            return True
+
+        if self.policy == DROP_LOW_PRIORITY:
+            for i, (queued_priority, _) in enumerate(self._messages):
+                if queued_priority == LOW:
+                    del self._messages[i]
+                    self.dropped += 1
+                    return True
+
+            if priority == LOW:
+                self.dropped += 1
+                return False
+
+        self._messages.popleft()
+        self.dropped += 1
+
+        return True
+
+    def _record_enqueue(self):
+        now = time.time()
+        self._enqueue_times.append(now)
+        self._expire_enqueue_times(now)
+
+#### EOF ######################################################################
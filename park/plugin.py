@@ -49,7 +49,7 @@ def wrap_as_bot_command(bot, function, name):
 
             if n <= 3:
                 args = allowed_args[3-n:]
-                with captured_stdout() as captured:
+                with captured_stdout(local=True) as captured:
                     result = function(*args)
 
                 if captured.output:
@@ -1,22 +1,32 @@
+""" Leave messages for users, to be delivered when they are back.
+
+The messages are saved in the bot's storage, and are delivered together
+when the user first says something, or comes online.
+
+"""
+
+# Standard library
+import threading
+
+# Messages are saved in this namespace of the bot's storage, by recipient
+NAMESPACE = 'mailbox'
+
+
 def message_processor(bot, user, text):
-    """ Tweet the story, if message starts with >>>"""
+    """ Deliver the messages left for the user, if any. """
 
-    pending_messages = getattr(bot, 'pending_messages', {})
-    if user in pending_messages:
+    _deliver(bot, user)
 
-        messages = [
-            '%s -- %s' % (bot.users[email], text)
-            for email, text in pending_messages.pop(user, [])
-        ]
+    return
 
-        msg = (
-            '%s, the following messages were sent to you, '
-            'while you were offline :: \n' % bot.users[user]
-        )
 
-        msg += '\n'.join(messages)
+def presence_processor(bot, user, status):
+    """ Deliver the messages left for the user, when they come online. """
+
+    if status != bot.OFFLINE:
+        _deliver(bot, user)
 
-        bot.send(user, msg)
+    return
 
 
 def main(bot, user, text):
@@ -34,22 +44,115 @@ def main(bot, user, text):
             message = 'Need a message to leave for the user.'
 
         else:
-            # fixme: have a function that plugins can add to bot's start-up?
-            # may not help much because plugins are added at runtime...
-            # plugin.initialize, basically.  should be called on
-            # install/initialization too.
-            if not hasattr(bot, 'pending_messages'):
-                bot.pending_messages = bot.read_state().get(
-                    'pending_messages', {}
-                )
-
-            bot.pending_messages.setdefault(email, []).append((user, msg))
+            _get_mailbox(bot).put(email, user, msg)
 
             message = (
                 'Your message will be delivered to %s, '
-                'when they are online.\n'
-                'Note: these messages are not persisted and '
-                'may be lost if we restart!' % nick
+                'when they are online.' % nick
             )
 
         return message
+
+
+class Mailbox(object):
+    """ Messages left for users, saved in a storage, keyed by recipient.
+
+    Changes are written through to the storage, and the recipients with
+    messages are also kept in memory, so that checking for messages doesn't
+    touch the storage.
+
+    """
+
+    def __init__(self, storage, namespace=NAMESPACE):
+        self.storage = storage
+        self.namespace = namespace
+
+        self._lock = threading.Lock()
+        self._recipients = set(
+            recipient for recipient, _ in storage.items(namespace)
+        )
+
+    def __contains__(self, recipient):
+        return recipient in self._recipients
+
+    def __len__(self):
+        return len(self._recipients)
+
+    def __repr__(self):
+        return '<Mailbox: messages for %d user(s)>' % len(self)
+
+    #### 'Mailbox' protocol ###################################################
+
+    def put(self, recipient, sender, text):
+        """ Save a message from the sender for the recipient. """
+
+        with self._lock:
+            messages = self.storage.get(self.namespace, recipient, [])
+            messages.append([sender, text])
+            self.storage.set(self.namespace, recipient, messages)
+            self._recipients.add(recipient)
+
+        return
+
+    def take(self, recipient):
+        """ Remove and return the (sender, text) messages of the recipient.
+
+        """
+
+        if recipient not in self._recipients:
+            return []
+
+        with self._lock:
+            with self.storage.transaction():
+                messages = self.storage.get(self.namespace, recipient, [])
+                self.storage.delete(self.namespace, recipient)
+
+            self._recipients.discard(recipient)
+
+        return [tuple(message) for message in messages]
+
+
+#### Private protocol #########################################################
+
+def _deliver(bot, user):
+    """ Send all the messages left for the user, in one message.
+
+    Messages for members who aren't subscribed (invited, or in dnd mode)
+    are kept until they are.
+
+    """
+
+    mailbox = _get_mailbox(bot)
+    if user not in mailbox or user not in bot.users:
+        return
+
+    messages = [
+        '%s -- %s' % (bot.users.get(email, email), text)
+        for email, text in mailbox.take(user)
+    ]
+
+    if len(messages) == 0:
+        return
+
+    msg = (
+        '%s, the following messages were sent to you, '
+        'while you were offline :: \n' % bot.users.get(user, user)
+    )
+
+    msg += '\n'.join(messages)
+
+    bot.send(user, msg)
+
+    return
+
+
+def _get_mailbox(bot):
+    """ Return the bot's mailbox, creating it if required. """
+
+    with bot.lock:
+        if getattr(bot, 'msg_mailbox', None) is None:
+            bot.msg_mailbox = Mailbox(bot.storage)
+
+    return bot.msg_mailbox
+
+#### EOF ######################################################################
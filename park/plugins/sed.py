@@ -5,61 +5,288 @@ s/foo/bar replaces "foo" with "bar" in the last HISTORY_LENGTH messages.
 The replace lets users replace text in other users messages, as well,
 but preference is given to messages of the user.
 
+The replacements are done in a worker process, which is killed if it takes
+longer than MATCH_TIMEOUT, so that patterns with catastrophic backtracking
+cannot hang the bot.
+
 """
 
 # Standard library
+from collections import deque
+from multiprocessing import Pipe, Process
 import re
+import threading
 
 # 3rd party library
 
 # Project library
+from park.cache import Cache
+
+# Messages in the history of the room, and of each user, oldest dropped first.
+HISTORY_LENGTH = 1000
+
+# Compiled patterns are cached, least recently used dropped first.
+PATTERN_CACHE_SIZE = 128
 
-HISTORY_LENGTH = 5  # keep only the last 5 messages in history.
+# Seconds within which a replacement must be done.
+MATCH_TIMEOUT = 1
 
 
 def message_processor(bot, user, text):
-    """ Dump a message to the db in the bot's root, if it has a url. """
+    """ Replace text in an earlier message, or save the message to history.
 
-    history = getattr(bot, 'history', [])
+    """
+
+    history = _get_history(bot)
 
     expression = re.match('s/([^/]+)/([^/]*)/?', text)
-    if expression is not None:
-        replacements = []
+    if expression is None:
+        history.append(user, text)
+        return
+
+    pattern, replacement = expression.groups()
+
+    # Invited members can talk too, and senders in the history may have left.
+    nick = bot.users.get(user, user)
 
-        for sender, message in history:
-            try:
-                replaced, n = re.subn(
-                    expression.group(1), expression.group(2), message
-                )
+    # Messages of the user are preferred, and newer messages are preferred.
+    entries = history.get_messages(user) + [
+        entry for entry in history.get_messages() if entry[0] != user
+    ]
 
-                if n > 0:
-                    replacements.append((sender, replaced))
+    try:
+        index, replaced = _get_matcher().replace(
+            pattern, replacement, [message for _, message in entries]
+        )
 
-            except Exception:
-                # We simply print, because the attempt to replace isn't private
-                print '_%s, invalid regex._' % bot.users[sender]
-                break
+    except ValueError:
+        # We simply print, because the attempt to replace isn't private
+        print '_%s, invalid regex._' % nick
 
-        if len(replacements) == 0:
+    except RuntimeError:
+        print '_%s, that regex took too long._' % nick
+
+    else:
+        if index is None:
             print (
                 '_%s, No replacements found. May be your message is too old_'
-                % bot.users[user]
+                % nick
             )
 
-        elif len(replacements) == 1:
-            sender, replaced = replacements[0]
-            print '_%s meant %s_' % (bot.users[sender], replaced)
-
         else:
-            users_messages = [(s, r) for s, r in replacements if s == user]
-            if len(users_messages) > 0:
-                sender, replaced = users_messages[0]
-                print '_%s meant %s_' % (bot.users[sender], replaced)
+            sender = entries[index][0]
+            print '_%s meant %s_' % (bot.users.get(sender, sender), replaced)
 
-            else:
-                sender, replaced = users_messages[0]
-                print '_%s meant %s_' % (bot.users[sender], replaced)
+    return
 
-    else:
-        history.insert(0, (user, text))
-        bot.history = history[:HISTORY_LENGTH]
+
+class History(object):
+    """ A ring buffer of the latest messages, indexed by user.
+
+    Only the latest ``size`` messages of the room are kept, and the
+    messages of each user are looked up without going through the others.
+
+    """
+
+    def __init__(self, size=HISTORY_LENGTH):
+        self.size = size
+
+        self._messages = deque(maxlen=size)
+        self._users = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._messages)
+
+    def __repr__(self):
+        return '<History: %d/%d messages, from %d user(s)>' % (
+            len(self), self.size, len(self._users)
+        )
+
+    #### 'History' protocol ###################################################
+
+    def append(self, user, message):
+        """ Add a message of the user, dropping the oldest if full. """
+
+        with self._lock:
+            if len(self._messages) == self.size:
+                oldest_user, _ = self._messages.popleft()
+                messages = self._users[oldest_user]
+                messages.popleft()
+                if len(messages) == 0:
+                    del self._users[oldest_user]
+
+            entry = (user, message)
+            self._messages.append(entry)
+            self._users.setdefault(user, deque()).append(entry)
+
+        return
+
+    def get_messages(self, user=None):
+        """ Return (user, message) pairs, newest first, of the user or all.
+
+        """
+
+        with self._lock:
+            messages = (
+                self._messages if user is None
+                else self._users.get(user, ())
+            )
+
+            return list(reversed(messages))
+
+
+class Matcher(object):
+    """ Replaces text with patterns in a worker process, with a timeout.
+
+    The worker keeps an LRU cache of compiled patterns.  It is killed when
+    a replacement takes longer than ``timeout`` seconds, and a new one is
+    started for the next replacement.
+
+    """
+
+    def __init__(self, timeout=MATCH_TIMEOUT):
+        self.timeout = timeout
+        self.timeouts = 0
+
+        self._process = None
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<Matcher: %s, %d timeout(s)>' % (
+            'running' if self._process is not None else 'stopped',
+            self.timeouts
+        )
+
+    #### 'Matcher' protocol ###################################################
+
+    def replace(self, pattern, replacement, messages):
+        """ Replace the pattern in the first message it matches.
+
+        Returns the index of the message and the replaced text, or (None,
+        None) if none of the messages match.  Raises a ValueError for an
+        invalid pattern, and a RuntimeError if it takes too long.
+
+        """
+
+        with self._lock:
+            self._start()
+            self._connection.send((pattern, replacement, messages))
+
+            if not self._connection.poll(self.timeout):
+                self.timeouts += 1
+                self._stop()
+                raise RuntimeError('Replacing %s timed out' % pattern)
+
+            index, replaced, error = self._connection.recv()
+
+        if error is not None:
+            raise ValueError(error)
+
+        return index, replaced
+
+    def stop(self):
+        """ Stop the worker process. """
+
+        with self._lock:
+            self._stop()
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _start(self):
+        if self._process is not None and self._process.is_alive():
+            return
+
+        self._stop()
+        self._connection, connection = Pipe()
+        self._process = Process(target=_replace_forever, args=(connection,))
+        self._process.daemon = True
+        self._process.start()
+
+        return
+
+    def _stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            self._process.join()
+            self._connection.close()
+
+        self._process = self._connection = None
+
+        return
+
+
+#### Private protocol #########################################################
+
+_MATCHER = None
+_LOCK = threading.Lock()
+
+
+def _get_history(bot):
+    """ Return the bot's history of messages, creating it if required. """
+
+    with bot.lock:
+        if not isinstance(getattr(bot, 'history', None), History):
+            bot.history = History()
+
+    return bot.history
+
+
+def _get_matcher():
+    """ Return the matcher, creating it if required. """
+
+    global _MATCHER
+
+    with _LOCK:
+        if _MATCHER is None:
+            _MATCHER = Matcher()
+
+    return _MATCHER
+
+
+def _replace(patterns, pattern, replacement, messages):
+    """ Return the index and the replaced text of the first match. """
+
+    regex = patterns.get(pattern)
+    if regex is None:
+        regex = re.compile(pattern)
+        patterns.set(pattern, regex)
+
+    for index, message in enumerate(messages):
+        replaced, n = regex.subn(replacement, message)
+        if n > 0:
+            return index, replaced
+
+    return None, None
+
+
+def _replace_forever(connection):
+    """ Do the replacements asked for on the connection, in the worker. """
+
+    patterns = Cache(PATTERN_CACHE_SIZE)
+
+    while True:
+        try:
+            pattern, replacement, messages = connection.recv()
+
+        except EOFError:
+            break
+
+        try:
+            index, replaced = _replace(
+                patterns, pattern, replacement, messages
+            )
+            error = None
+
+        except Exception as e:
+            index = replaced = None
+            error = '%s: %s' % (e.__class__.__name__, e)
+
+        connection.send((index, replaced, error))
+
+    return
+
+#### EOF ######################################################################
@@ -1,10 +1,18 @@
 REQUIREMENTS = ['python-twitter']
 
+# Standard library
+from HTMLParser import HTMLParser
+from os.path import join
+import threading
+import time
+
 # 3rd-party library
 from requests_oauthlib import OAuth1Session
 import twitter
 
 # Project library
+from park.spool import Rejected, Spool
+
 # fixme: should we have a way to add stuff into settings.py?
 try:
     from park.settings import (
@@ -19,6 +27,22 @@ APP_URL = 'https://twitter.com/settings/applications'
 AUTHORIZATION_URL = 'https://api.twitter.com/oauth/authorize'
 REQUEST_TOKEN_URL = 'https://api.twitter.com/oauth/request_token'
 
+# Maximum tweets in a page of the timeline, as allowed by twitter
+PAGE_SIZE = 200
+
+# Seconds for which the cached timeline is used, without checking for more
+TIMELINE_REFRESH_INTERVAL = 5 * 60
+
+# Stories are published in the background, and failed posts are retried with
+# backoff (in seconds).  Identical stories told within the window are ignored.
+PUBLISH_ATTEMPTS = 5
+PUBLISH_BACKOFF = 60
+PUBLISH_WINDOW = 60 * 60
+
+# Errors from twitter that are worth retrying: rate limited, over capacity,
+# internal error and over the daily limit of updates.
+RETRY_ERROR_CODES = (88, 130, 131, 185)
+
 
 def message_processor(bot, user, text):
     """ Tweet the story, if message starts with >>>"""
@@ -29,6 +53,14 @@ def message_processor(bot, user, text):
     return
 
 
+def idle_hook(bot):
+    """ Resume publishing the stories left in the spool by a restart. """
+
+    _get_publisher(bot).resume()
+
+    return
+
+
 def main(bot, user, text):
     """ Get link to the story archive or register!
 
@@ -104,34 +136,255 @@ def main(bot, user, text):
 def get_tweets_since(last_checked=None, since_id=None):
     """ Return the list of tweets after a specified time or id.
 
-    If an id is not specified, either all tweets newer than the specified
-    timestamp or a maximum of 200 tweets are returned.
+    If neither is specified, a maximum of 200 tweets are returned.
 
     """
 
-    api = twitter.Api(
-        consumer_key=CONSUMER_KEY,
-        consumer_secret=CONSUMER_SECRET,
-        access_token_key=ACCESS_TOKEN_KEY,
-        access_token_secret=ACCESS_TOKEN_SECRET
-    )
+    return _get_timeline().get_tweets_since(last_checked, since_id)
+
+
+class Publisher(object):
+    """ Publishes stories to twitter, through a persistent spool.
+
+    Posts are retried with backoff, when twitter or the network fail, and
+    the author is told once the story is published or given up on.  A story
+    identical to one told within the last ``window`` seconds is ignored.
+
+    """
 
-    # 200 limit is set by twitter? python-twitter doesn't let count > 200.
-    try:
-        tweets = api.GetUserTimeline(
-            count=200, since_id=since_id, include_rts=False
+    def __init__(self, bot, directory, window=PUBLISH_WINDOW, api=None):
+        self.bot = bot
+        self.window = window
+        self.spool = Spool(
+            directory, self._post, 'stories.publish',
+            max_attempts=PUBLISH_ATTEMPTS, backoff=PUBLISH_BACKOFF,
+            failed=self._failed
         )
 
-    except Exception:
-        tweets = []
+        self._api = api
+        self._told = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<Publisher: %d pending, %d told recently>' % (
+            self.spool.pending, len(self._told)
+        )
+
+    #### 'Publisher' protocol #################################################
+
+    def publish(self, story, user):
+        """ Queue the story to be published; returns the job id.
+
+        Returns None, if the story was already told within the window.
+
+        """
+
+        key = _normalize_story(story)
+        now = time.time()
+
+        with self._lock:
+            for told, timestamp in self._told.items():
+                if now - timestamp > self.window:
+                    del self._told[told]
+
+            if key in self._told:
+                return None
+
+            self._told[key] = now
+
+        job_id = self.spool.put({'story': story, 'user': user})
+        self.resume()
+
+        return job_id
+
+    def resume(self):
+        """ Publish the queued stories, in the background unless debugging.
+
+        """
+
+        if self.bot.debug:
+            self.spool.process()
+
+        else:
+            self.spool.start()
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _failed(self, item, errors):
+        """ Tell the author that the story couldn't be published. """
+
+        with self._lock:
+            self._told.pop(_normalize_story(item['story']), None)
+
+        self.bot.send(
+            item['user'],
+            'Sorry, your story could not be published: %s' % errors[-1]
+        )
+
+        return
+
+    def _post(self, item):
+        """ Post the story, and tell the author about it.
+
+        Raises an error for failures worth retrying, and :class:`Rejected`
+        for the others.
+
+        """
+
+        api = self._api if self._api is not None else _get_api()
+
+        try:
+            api.PostUpdate(item['story'])
+
+        except twitter.TwitterError as e:
+            code, message = _get_error(e)
+            if code in RETRY_ERROR_CODES:
+                raise
+
+            raise Rejected(message)
+
+        # The story is published, and mustn't be retried from here on.
+        user = item['user']
+        try:
+            self.bot.send(
+                user,
+                'wOOt! You just got published %s'
+                % self.bot.users.get(user, user)
+            )
+
+        except Exception:
+            self.spool.log.exception('Could not tell %s', user)
+
+        return
+
+
+class Timeline(object):
+    """ The timeline of our stories account, cached by tweet id.
+
+    The tweets asked for are fetched a page at a time, going back with
+    ``max_id`` until the asked for time or id is covered.  Later, only the
+    tweets newer than the cached ones are fetched, and not more often than
+    every ``refresh_interval`` seconds.  Cached tweets older than the
+    ``since_id`` asked for are dropped.
+
+    Twitter escapes ``&``, ``<`` and ``>`` in the text of tweets, and the
+    text is unescaped here, so that it is escaped only once when rendered.
+
+    """
+
+    def __init__(self, api, refresh_interval=TIMELINE_REFRESH_INTERVAL):
+        self.api = api
+        self.refresh_interval = refresh_interval
+        self.requests = 0
+
+        self._tweets = {}
+        self._covered = None
+        self._refreshed = 0
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<Timeline: %d cached tweet(s), %d request(s)>' % (
+            len(self._tweets), self.requests
+        )
 
-    if last_checked is not None:
-        tweets = [
-            tweet for tweet in tweets
-            if tweet.created_at_in_seconds > _to_seconds(last_checked)
-        ]
+    def get_tweets_since(self, last_checked=None, since_id=None):
+        """ Return the tweets after the given time and id, newest first. """
 
-    return tweets
+        after = _to_seconds(last_checked) if last_checked is not None else 0
+        since_id = since_id or 0
+
+        with self._lock:
+            for id_ in [id_ for id_ in self._tweets if id_ <= since_id]:
+                del self._tweets[id_]
+
+            try:
+                self._refresh(since_id, after)
+
+            except Exception:
+                pass
+
+            tweets = [
+                tweet for tweet in self._tweets.itervalues()
+                if tweet.created_at_in_seconds > after
+            ]
+
+        return sorted(tweets, key=lambda tweet: tweet.id, reverse=True)
+
+    #### Private protocol #####################################################
+
+    def _fetch(self, since_id, after):
+        """ Fetch the tweets after the given id and time, a page at a time.
+
+        Only one page is fetched if neither of them is given.
+
+        """
+
+        max_id = None
+
+        while True:
+            self.requests += 1
+            page = self.api.GetUserTimeline(
+                since_id=since_id or None, max_id=max_id, count=PAGE_SIZE,
+                include_rts=False
+            )
+            for tweet in page:
+                tweet.text = _unescape(tweet.text)
+                self._tweets[tweet.id] = tweet
+
+            if (
+                len(page) == 0 or (since_id == 0 and after == 0) or
+                page[-1].created_at_in_seconds <= after
+            ):
+                break
+
+            max_id = page[-1].id - 1
+
+        return
+
+    def _refresh(self, since_id, after):
+        """ Fetch the tweets that are not cached, if required. """
+
+        covered = (
+            self._covered is not None and
+            since_id >= self._covered[0] and after >= self._covered[1]
+        )
+
+        if not covered:
+            self._fetch(since_id, after)
+            self._covered = (since_id, after)
+
+        elif time.time() - self._refreshed > self.refresh_interval:
+            newest = max([since_id] + self._tweets.keys())
+            self._fetch(newest, 0 if newest else after)
+
+        else:
+            return
+
+        self._refreshed = time.time()
+
+        return
+
+
+#### Private protocol #########################################################
+
+_API = None
+_TIMELINE = None
+_LOCK = threading.Lock()
+
+
+def _get_error(error):
+    """ Return the code and message of a twitter error. """
+
+    details = error.message
+    if isinstance(details, list) and len(details) > 0:
+        details = details[0]
+
+    if isinstance(details, dict):
+        return details.get('code'), details.get('message')
+
+    return None, str(details)
 
 
 def _get_authorization_url():
@@ -146,6 +399,49 @@ def _get_authorization_url():
     return authorization_url, oauth_token, oauth_token_secret
 
 
+def _get_api():
+    """ Return the long-lived twitter client, creating it if required. """
+
+    global _API
+
+    with _LOCK:
+        if _API is None:
+            _API = twitter.Api(
+                consumer_key=CONSUMER_KEY,
+                consumer_secret=CONSUMER_SECRET,
+                access_token_key=ACCESS_TOKEN_KEY,
+                access_token_secret=ACCESS_TOKEN_SECRET
+            )
+
+    return _API
+
+
+def _get_publisher(bot):
+    """ Return the bot's publisher of stories, creating it if required. """
+
+    with bot.lock:
+        if getattr(bot, 'stories_publisher', None) is None:
+            bot.stories_publisher = Publisher(
+                bot, join(bot.root, 'spool', 'stories')
+            )
+
+    return bot.stories_publisher
+
+
+def _get_timeline():
+    """ Return the cached timeline, creating it if required. """
+
+    global _TIMELINE
+
+    api = _get_api()
+
+    with _LOCK:
+        if _TIMELINE is None:
+            _TIMELINE = Timeline(api)
+
+    return _TIMELINE
+
+
 def _get_twitter_handle(token, secret, pin):
 
     client = OAuth1Session(
@@ -160,24 +456,10 @@ def _get_twitter_handle(token, secret, pin):
     return data['screen_name']
 
 
-def _post_tweet(text):
-    """ Post the given text, using credentials from our settings. """
-
-    api = twitter.Api(
-        consumer_key=CONSUMER_KEY,
-        consumer_secret=CONSUMER_SECRET,
-        access_token_key=ACCESS_TOKEN_KEY,
-        access_token_secret=ACCESS_TOKEN_SECRET
-    )
-
-    try:
-        api.PostUpdate(text)
-        message = None
-
-    except twitter.TwitterError as e:
-        message = e.message[0]['message']
+def _normalize_story(story):
+    """ Return a key to identify identical stories. """
 
-    return message
+    return ' '.join(story.lower().split())
 
 
 def _to_seconds(timestamp):
@@ -186,8 +468,18 @@ def _to_seconds(timestamp):
     return (timestamp - timestamp.utcfromtimestamp(0)).total_seconds()
 
 
+def _unescape(text):
+    """ Return the text of a tweet, with the html entities unescaped. """
+
+    return HTMLParser().unescape(text) if text else text
+
+
 def _tweet_story(bot, story, user):
-    """ Tweets the story if it is within 10 words and 140 chars."""
+    """ Queue the story to be tweeted, if it is within 10 words.
+
+    The author is told when the story is published.
+
+    """
 
     if len(story.split()) > 10:
         message = (
@@ -204,10 +496,9 @@ def _tweet_story(bot, story, user):
     if user in bot.storytellers:
         story += ' - @' + bot.storytellers[user]
 
-    message = _post_tweet(story)
-    if message is None:
-        message = 'wOOt! You just got published %s' % bot.users[user]
+    if _get_publisher(bot).publish(story, user) is None:
+        print 'That story was already told!'
 
-    print message
+    return
 
 #### EOF ######################################################################
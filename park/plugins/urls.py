@@ -3,25 +3,52 @@ REQUIREMENTS = ['ago']
 # Standard library
 import datetime
 import hashlib
+import json
 import os
-from os.path import abspath, dirname, join
-import shutil
-from urllib2 import Request, urlopen
-
-from lxml import html
-
+from os.path import abspath, dirname, exists, join
+import re
+from StringIO import StringIO
+import threading
+import time
+from urllib2 import HTTPError, Request, urlopen
+import urlparse
 
 # 3rd party library
-from premailer import transform
+from lxml import html
 
 # Project library
-from park import serialize
+from park.cache import StorageCache
+from park.executor import WorkerPool
 from park.plugins.stories import get_tweets_since
-from park.serialize import read_state, save_state
+from park.serialize import read_state
 from park.util import is_url, render_template, send_email
 
 HERE = dirname(abspath(__file__))
-DB_NAME = 'newsletter.json'
+DB_NAME = 'newsletter.jsonl'
+
+# The urls used to be saved as one JSON list, in this file
+LEGACY_DB_NAME = 'newsletter.json'
+
+# Check for the weekly newsletter once an hour
+IDLE_INTERVAL = '@hourly'
+
+# Titles and descriptions of urls are cached, and revalidated after a day.
+# Changes to the cache are saved together, at most CACHE_SAVE_DELAY later.
+CACHE_NAMESPACE = 'url_metadata'
+CACHE_SIZE = 1000
+CACHE_TTL = 24 * 60 * 60
+CACHE_SAVE_DELAY = 30
+
+# Urls are fetched concurrently, with a timeout for each fetch, and an
+# overall deadline for all the urls in a message (in seconds)
+FETCH_WORKERS = 8
+FETCH_TIMEOUT = 10
+MESSAGE_DEADLINE = 15
+
+# Only the <head> of html pages is read, and at most these many bytes of it
+HEAD_BYTES = 64 * 1024
+HTML_TYPES = ('text/html', 'application/xhtml+xml')
+_HEAD_END = re.compile(r'</head\s*>|<body', re.IGNORECASE)
 
 
 def message_processor(bot, user, text):
@@ -32,23 +59,28 @@ def message_processor(bot, user, text):
     if len(urls) == 0:
         return
 
+    deadline = time.time() + MESSAGE_DEADLINE
+    pool = _get_fetch_pool(bot)
+    jobs = [pool.submit(_get_metadata, bot, url) for url in urls]
     entries = []
 
-    for url in urls:
-        content = _get_parsed_content(url)
+    for url, job in zip(urls, jobs):
+        if job.wait(max(0, deadline - time.time())) and job.exception is None:
+            metadata = job.result
+
+        else:
+            metadata = {'title': '', 'description': ''}
+
         entry = {
             'url': url,
-            'title': _get_title(content) or url,
-            'description': _get_description(content),
+            'title': metadata['title'] or url,
+            'description': metadata['description'],
             'user': user,
             'timestamp': datetime.datetime.now().isoformat()
         }
         entries.append(entry)
 
-    path = join(bot.root, DB_NAME)
-    bot.lock.acquire()
-    _save_entries(path, entries)
-    bot.lock.release()
+    _get_digest(bot).add(entries)
 
     return
 
@@ -66,9 +98,8 @@ def idle_hook(bot):
         _save_timestamp(bot)
 
     elif _time_since(last_newsletter).days >= 7:
-        db = join(bot.root, DB_NAME)
-        db = _archive_db(db)
-        _send_newsletter(bot, db, last_newsletter)
+        digest = _archive_db(bot)
+        _send_newsletter(bot, digest, last_newsletter)
         _save_timestamp(bot)
 
     return
@@ -77,39 +108,224 @@ def idle_hook(bot):
 def main(bot, user, args):
     """ Show URLs posted by buddies. The ones since I last checked """
 
-    path = join(bot.root, DB_NAME)
-
-    bot.lock.acquire()
-    data = serialize.read_state(path)
-    bot.lock.release()
+    digest = _get_digest(bot)
 
-    if len(data) == 0:
+    if len(digest) == 0:
         message = 'No new urls.'
 
     else:
         subject = 'Park updates since last newsletter'
         additional_content = {'stories': _get_stories(bot, save=False)}
-        body = _get_email(bot, path, subject, additional_content)
+        body = _get_email(bot, digest, subject, additional_content)
         send_email(user, subject, body, typ_='html', debug=bot.debug)
         message = 'Sent email to %s' % user
 
     return message
 
 
+class UrlLog(object):
+    """ The shared urls, appended to a file as one JSON object a line.
+
+    The byte offset of each entry is kept in an index, so that appending
+    doesn't need to read the file, and entries can be streamed starting
+    from any entry.
+
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        self._offsets = None
+        self._lock = threading.Lock()
+
+    def __iter__(self):
+        return self.read()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._get_offsets())
+
+    def append(self, entries):
+        """ Append the entries to the log. """
+
+        lines = [json.dumps(entry) + '\n' for entry in entries]
+
+        with self._lock:
+            offsets = self._get_offsets()
+            with open(self.path, 'ab') as f:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                for line in lines:
+                    offsets.append(offset)
+                    offset += len(line)
+                f.write(''.join(lines))
+
+        return
+
+    def archive(self, path):
+        """ Move the entries to the given path, and start an empty log. """
+
+        with self._lock:
+            if exists(self.path):
+                os.rename(self.path, path)
+            self._offsets = []
+
+        return path
+
+    def read(self, start=0):
+        """ Yield the entries, starting from the entry at index start. """
+
+        with self._lock:
+            offsets = self._get_offsets()
+            if start >= len(offsets):
+                return
+            begin, count = offsets[start], len(offsets)
+
+        with open(self.path, 'rb') as f:
+            f.seek(begin)
+            for _ in range(count - start):
+                yield json.loads(f.readline())
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _get_offsets(self):
+        """ Return the index of offsets, building it if required.
+
+        A partially written last line, from a crash, is truncated.
+
+        """
+
+        if self._offsets is None:
+            self._offsets = []
+            offset = 0
+
+            if exists(self.path):
+                with open(self.path, 'r+b') as f:
+                    for line in f:
+                        if not line.endswith('\n'):
+                            f.truncate(offset)
+                            break
+                        self._offsets.append(offset)
+                        offset += len(line)
+
+        return self._offsets
+
+
+class Digest(object):
+    """ The entries of the newsletter, prepared as the urls are logged.
+
+    Each entry is prepared and put into its section once, when it is added,
+    and repeated urls are dropped.  Only the names and the (relative) times
+    are filled in when the newsletter is rendered.
+
+    """
+
+    def __init__(self, url_log, sections=None):
+        self.url_log = url_log
+
+        self._sections = {'code_updates': [], 'shared_links': []}
+        self._urls = set()
+        self._lock = threading.Lock()
+
+        if sections is None:
+            self._add(url_log.read())
+
+        else:
+            self._sections, self._urls = sections
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._sections.values())
+
+    def add(self, entries):
+        """ Log the entries, and add them to the digest. """
+
+        with self._lock:
+            self.url_log.append(entries)
+            self._add(entries)
+
+        return
+
+    def archive(self, path):
+        """ Move the logged urls to path, and return a digest of them.
+
+        The digest is empty afterwards.
+
+        """
+
+        with self._lock:
+            archived = Digest(
+                UrlLog(self.url_log.archive(path)),
+                (self._sections, self._urls)
+            )
+            self._sections = {'code_updates': [], 'shared_links': []}
+            self._urls = set()
+
+        return archived
+
+    def get_context(self, bot):
+        """ Return the sections of entries, as context for the template. """
+
+        from ago import human
+
+        with self._lock:
+            sections = dict(
+                (name, list(entries))
+                for name, entries in self._sections.iteritems()
+            )
+
+        for entries in sections.values():
+            for i, entry in enumerate(entries):
+                email = entry['user']
+                entries[i] = dict(
+                    entry,
+                    name=bot.users.get(email) or bot.invited.get(email, email),
+                    human_timestamp=human(entry['datetime']),
+                )
+
+        return sections
+
+    #### Private protocol #####################################################
+
+    def _add(self, entries):
+        for entry in entries:
+            url = _normalize_url(entry['url']) if entry['url'] else ''
+            if len(url) == 0 or url in self._urls:
+                continue
+
+            self._urls.add(url)
+            entry = dict(entry)
+            entry['hash'] = hashlib.md5(entry['user']).hexdigest()
+            if len(entry.get('title', '').strip()) == 0:
+                entry['title'] = entry['url']
+            entry['datetime'] = _parse_timestamp(entry['timestamp'])
+
+            if 'github.com/punchagan/childrens-park' in entry['url']:
+                self._sections['code_updates'].append(entry)
+
+            else:
+                self._sections['shared_links'].append(entry)
+
+        return
+
+
 #### Private protocol #########################################################
 
 _TIMESTAMP_FMT = '%Y-%m-%dT%H:%M:%S.%f'
 
 
-def _archive_db(path):
-    """ Move the db file to a name with the time stamp. """
+def _archive_db(bot):
+    """ Move the url log to a file with the time stamp.
+
+    Returns the digest of the archived urls.
+
+    """
 
     timestamp = datetime.datetime.now().strftime('%Y-%m-%d-%H-%M-%S')
-    new_path = join(dirname(path), 'newsletter-%s.json' % timestamp)
-    shutil.copy(path, new_path)
-    os.unlink(path)
+    new_path = join(bot.root, 'newsletter-%s.jsonl' % timestamp)
 
-    return new_path
+    return _get_digest(bot).archive(new_path)
 
 
 def _get_description(content):
@@ -137,77 +353,122 @@ def _get_description(content):
     else:
         description = max(descriptions, key=len)
 
-    return description.strip().encode('utf8')
+    return description.strip()
 
 
-def _get_email_content(bot, urls):
-    """" Return the content section of the email. """
+def _get_digest(bot):
+    """ Return the bot's digest of logged urls, creating it if required. """
 
-    from ago import human
+    url_log = _get_url_log(bot)
 
-    # fixme: we could do a better job with repeated items, order of urls
+    with bot.lock:
+        if getattr(bot, 'url_digest', None) is None:
+            bot.url_digest = Digest(url_log)
 
-    for entry in urls:
-        email = entry['user']
-        entry['name'] = bot.users.get(email) or bot.invited.get(email, email)
-        entry['hash'] = hashlib.md5(email).hexdigest()
-        if 'title' not in entry or len(entry['title'].strip()) == 0:
-            entry['title'] = entry['url']
+    return bot.url_digest
 
-        entry['human_timestamp'] = human(
-            datetime.datetime.strptime(entry['timestamp'], _TIMESTAMP_FMT)
-        )
 
-    return urls
+def _get_email(bot, digest, title, additional_content=None):
+    """ Return the content to be used for the newsletter. """
 
+    context = digest.get_context(bot)
+    context['title'] = title
 
-def _get_email(bot, db, title, additional_content=None):
-    """ Return the content to be used for the newsletter. """
+    if additional_content is not None:
+        context.update(additional_content)
 
-    # Get urls from the db
-    bot.lock.acquire()
-    urls = serialize.read_state(db)
-    bot.lock.release()
+    template = join(HERE, 'data', 'newsletter_template.html')
+    return render_template(template, context, inline_css=True)
 
-    entries = [
-        entry for entry in _get_email_content(bot, urls[:])
 
-        if len(entry['url']) != 0
-    ]
-    context = {'title': title}
+def _get_fetch_pool(bot):
+    """ Return the bot's pool of threads to fetch urls, creating it. """
 
-    for entry in entries:
-        if 'github.com/punchagan/childrens-park' in entry['url']:
-            context.setdefault('code_updates', []).append(entry)
+    with bot.lock:
+        if getattr(bot, 'url_fetch_pool', None) is None:
+            bot.url_fetch_pool = WorkerPool(FETCH_WORKERS, 'urls.fetch')
 
-        else:
-            context.setdefault('shared_links', []).append(entry)
+    return bot.url_fetch_pool
 
-    if additional_content is not None:
-        context.update(additional_content)
 
-    template = join(HERE, 'data', 'newsletter_template.html')
-    return transform(render_template(template, context))
+def _get_metadata(bot, url):
+    """ Return the title and description of the url, cached if possible.
+
+    Expired entries in the cache are revalidated with a conditional request.
+
+    """
+
+    cache = _get_url_cache(bot)
+    key = _normalize_url(url)
+    metadata = cache.get(key)
+
+    if metadata is not None:
+        return metadata
+
+    cached = cache.peek(key)
+    headers = {}
+    if cached is not None and cached.get('etag'):
+        headers['If-None-Match'] = cached['etag']
+    if cached is not None and cached.get('last_modified'):
+        headers['If-Modified-Since'] = cached['last_modified']
+
+    content, info = _get_parsed_content(url, headers)
+
+    if info is None:
+        # Couldn't fetch the page, don't cache anything.
+        return cached or {'title': '', 'description': ''}
+
+    elif content is None:
+        # Not modified
+        metadata = cached
+
+    else:
+        metadata = {
+            'title': _get_title(content),
+            'description': _get_description(content),
+            'etag': info.get('ETag'),
+            'last_modified': info.get('Last-Modified'),
+        }
+
+    cache.set(key, metadata)
+
+    return metadata
 
 
-def _get_parsed_content(url):
-    """ Return the parsed html of a given page. """
+def _get_parsed_content(url, headers=None):
+    """ Return the parsed html head of a given page, and the response headers.
+
+    Only html pages are read, until the end of the head or ``HEAD_BYTES``.
+    The content is None if the page was not modified, and the headers are
+    None if the page couldn't be fetched.
+
+    """
+
+    headers = dict(headers or {})
+    headers['User-Agent'] = (
+        'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko)'
+    )
 
     try:
-        request = Request(
-            url,
-            headers={
-                'User-Agent':
-                'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko)'
-            }
+        request = Request(url, headers=headers)
+        response = urlopen(request, timeout=FETCH_TIMEOUT)
+        info = response.info()
+        head = (
+            _read_head(response, HEAD_BYTES)
+            if info.gettype() in HTML_TYPES else ''
         )
-        response = urlopen(request)
+        response.close()
+
+    except HTTPError as e:
+        if e.code == 304:
+            return None, e.info()
+
+        head, info = '', None
 
     except Exception:
-        from StringIO import StringIO
-        response = StringIO('<html></html>')
+        head, info = '', None
 
-    return html.parse(response)
+    return html.parse(StringIO(head or '<html></html>')), info
 
 
 def _get_title(content):
@@ -216,7 +477,7 @@ def _get_title(content):
     element = content.find('.//title')
     title = element.text or '' if element is not None else ''
 
-    return title.strip().encode('utf8')
+    return title.strip()
 
 
 def _get_stories(bot, save=True):
@@ -236,15 +497,76 @@ def _get_stories(bot, save=True):
     return tweets
 
 
-def _save_entries(path, entries):
-    """ Save the url data to the db. """
+def _get_url_cache(bot):
+    """ Return the bot's cache of url metadata, creating it if required. """
 
-    data = read_state(path)
-    data = [] if not data else data
-    data.extend(entries)
-    save_state(path, data)
+    with bot.lock:
+        if getattr(bot, 'url_cache', None) is None:
+            bot.url_cache = StorageCache(
+                bot.storage, CACHE_NAMESPACE, CACHE_SIZE, CACHE_TTL,
+                delay=0 if bot.debug else CACHE_SAVE_DELAY
+            )
 
-    return
+    return bot.url_cache
+
+
+def _get_url_log(bot):
+    """ Return the url log of the bot, creating it if required.
+
+    Urls saved in the legacy JSON list are moved to the log.
+
+    """
+
+    with bot.lock:
+        if getattr(bot, 'url_log', None) is None:
+            bot.url_log = UrlLog(join(bot.root, DB_NAME))
+            legacy_path = join(bot.root, LEGACY_DB_NAME)
+            if exists(legacy_path):
+                bot.url_log.append(read_state(legacy_path) or [])
+                os.unlink(legacy_path)
+
+    return bot.url_log
+
+
+def _normalize_url(url):
+    """ Return the url, without the parts that don't change the page. """
+
+    parts = urlparse.urlsplit(url.strip())
+    scheme, netloc = parts.scheme.lower(), parts.netloc.lower()
+    default_port = {'http': ':80', 'https': ':443'}.get(scheme)
+    if default_port is not None and netloc.endswith(default_port):
+        netloc = netloc[:-len(default_port)]
+
+    return urlparse.urlunsplit(
+        (scheme, netloc, parts.path or '/', parts.query, '')
+    )
+
+
+def _parse_timestamp(timestamp):
+    """ Parse an iso-formatted timestamp, with or without microseconds. """
+
+    if '.' not in timestamp:
+        timestamp += '.0'
+
+    return datetime.datetime.strptime(timestamp, _TIMESTAMP_FMT)
+
+
+def _read_head(response, limit):
+    """ Read the response until the end of the html head, or limit bytes. """
+
+    data = ''
+
+    while len(data) < limit:
+        chunk = response.read(min(8192, limit - len(data)))
+        if not chunk:
+            break
+
+        start = max(0, len(data) - len('</head >'))
+        data += chunk
+        if _HEAD_END.search(data, start) is not None:
+            break
+
+    return data
 
 
 def _save_timestamp(bot):
@@ -257,14 +579,14 @@ def _save_timestamp(bot):
     return
 
 
-def _send_newsletter(bot, db, last_sent):
+def _send_newsletter(bot, digest, last_sent):
     """ Send the newsletter and save the timestamp to the state. """
 
     last_sent = last_sent.strftime('%b %d')
     now = datetime.datetime.now().strftime('%b %d')
     subject = 'Parkly Newsletter for %s to %s' % (last_sent, now)
     additional_content = {'stories': _get_stories(bot)}
-    body = _get_email(bot, db, subject, additional_content)
+    body = _get_email(bot, digest, subject, additional_content)
     to = bot.users.keys() + bot.invited.keys()
 
     send_email(to, subject, body, typ_='html', debug=bot.debug)
@@ -1,42 +1,167 @@
 REQUIREMENTS = ['wolframalpha']
 
-import wolframalpha
+# Standard library
+import logging
 import threading
 
+# 3rd party library
+import wolframalpha
+
+# Project library
+from park.cache import Cache
+from park.executor import WorkerPool
+
+try:
+    from park.settings import WOLFRAM_API_KEY
+except ImportError:
+    WOLFRAM_API_KEY = None
+
+# Queries are answered by a few threads, and the answers are cached
+# (for CACHE_TTL seconds)
+WORKERS = 2
+CACHE_SIZE = 256
+CACHE_TTL = 6 * 60 * 60
+
+# Maximum number of pods sent to the room, when there is no 'Result' pod
+MAX_PODS = 3
+
 
 def main(bot, user, args):
     """ Fetch top most result from Wolfram Alpha. """
 
-    try:
-        from park.settings import WOLFRAM_API_KEY
-    except ImportError:
+    if WOLFRAM_API_KEY is None:
         return 'Need an API Key to be able to use Wolfram API.'
 
-    def query_wolfram(args):
-        results = wolframalpha.Client(WOLFRAM_API_KEY).query(args)
+    job = _get_wolfram(bot).ask(args, user)
 
-        for i, pod in enumerate(results.pods):
-            if pod.id == 'Result':
-                break
-        else:
-            pod = None
-            pods = list(results.pods)
+    # Wait for the answer when debugging, to make testing easier.
+    if job is not None and bot.debug:
+        job.wait()
 
-        if pod is not None or pods is not None:
-            bot.message_queue.append(
-                '%s wolframmed for %s... and here you go: '
-                % (bot.users[user], args)
-            )
+    return
+
+
+class Wolfram(object):
+    """ Answers queries using one client, a bounded pool and a cache.
+
+    Answers are cached for ``ttl`` seconds, and an identical query asked
+    while one is being answered waits for it, instead of making another
+    request.  ``answered`` is called with the query, the answer (a list of
+    (title, text) pods, or None on errors) and the users who asked.
+
+    """
 
-            if pod is not None:
-                bot.message_queue.extend([pod.title, pod.text])
+    def __init__(self, client, answered, workers=WORKERS, size=CACHE_SIZE,
+                 ttl=CACHE_TTL, log=None):
+        self.log = log if log is not None else logging.getLogger(__name__)
+        self.client = client
+        self.answered = answered
+        self.cache = Cache(size, ttl)
+        self.pool = WorkerPool(workers, 'wolfram.query', self.log)
+
+        self._asking = {}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '<Wolfram: %d asking, %r>' % (len(self._asking), self.cache)
+
+    #### 'Wolfram' protocol ###################################################
+
+    def ask(self, query, user):
+        """ Answer the query asked by the user.
+
+        Returns the job answering the query, or None if the answer was
+        cached.
+
+        """
+
+        key = ' '.join(query.lower().split())
+
+        with self._lock:
+            pods = self.cache.get(key)
+
+            if pods is not None:
+                job = None
+
+            elif key in self._asking:
+                job, users = self._asking[key]
+                users.append(user)
 
             else:
-                for pod in pods:
-                    bot.message_queue.extend([pod.title, pod.text])
+                job = self.pool.submit(self._answer, key, query)
+                self._asking[key] = (job, [user])
+
+        if pods is not None:
+            self.answered(query, pods, [user])
+
+        return job
+
+    #### Private protocol #####################################################
+
+    def _answer(self, key, query):
+        """ Query Wolfram Alpha, and give the answer to all who asked. """
+
+        try:
+            pods = self._query(query)
+
+        except Exception:
+            self.log.exception('Error querying Wolfram Alpha for %s', query)
+            pods = None
+
+        with self._lock:
+            if pods is not None:
+                self.cache.set(key, pods)
+            _, users = self._asking.pop(key)
+
+        self.answered(query, pods, users)
+
+        return
+
+    def _query(self, query):
+        """ Return the 'Result' pod, or the first few pods, as (title, text).
+
+        """
+
+        pods = list(self.client.query(query).pods)
+
+        results = [pod for pod in pods if pod.id == 'Result']
+        pods = results[:1] if len(results) > 0 else pods[:MAX_PODS]
+
+        return [(pod.title, pod.text or '') for pod in pods]
+
+
+#### Private protocol #########################################################
+
+def _get_wolfram(bot):
+    """ Return the bot's Wolfram Alpha client, creating it if required. """
+
+    def answered(query, pods, users):
+        if pods is None or len(pods) == 0:
+            message = (
+                'No results found!' if pods is not None
+                else 'Could not reach Wolfram Alpha, try again later!'
+            )
+            for user in users:
+                bot.send(user, message)
+
+            return
+
+        nicks = ', '.join(bot.users.get(user, user) for user in users)
+        bot.message_queue.append(
+            '%s wolframmed for %s... and here you go: ' % (nicks, query)
+        )
+
+        for title, text in pods:
+            bot.message_queue.extend([title, text])
+
+        return
+
+    with bot.lock:
+        if getattr(bot, 'wolfram', None) is None:
+            bot.wolfram = Wolfram(
+                wolframalpha.Client(WOLFRAM_API_KEY), answered, log=bot.log
+            )
 
-        else:
-            bot.send(user, 'No results found!')
+    return bot.wolfram
 
-    thread = threading.Thread(target=query_wolfram, args=(args,))
-    thread.start()
+#### EOF ######################################################################
@@ -0,0 +1,301 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Pacing of outbound stanzas, to stay within the limits of the server. """
+
+# Standard library
+from collections import deque
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+class TokenBucket(object):
+    """ A bucket that holds ``capacity`` tokens, refilled over ``period``.
+
+    Tokens are reserved ahead of time; the bucket can go into debt, and the
+    debt decides how long a reservation needs to wait.
+
+    """
+
+    def __init__(self, capacity, period, clock=time.time):
+        self.capacity = float(capacity)
+        self.rate = self.capacity / period
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """ Return the seconds until a token is available, without taking it.
+
+        """
+
+        with self._lock:
+            self._refill()
+
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    @property
+    def full(self):
+        """ True if the bucket has been refilled to its capacity. """
+
+        with self._lock:
+            self._refill()
+
+            return self._tokens >= self.capacity
+
+    def reserve(self):
+        """ Reserve a token, and return the seconds to wait to use it. """
+
+        with self._lock:
+            self._refill()
+            self._tokens -= 1
+
+            return max(0.0, -self._tokens / self.rate)
+
+    #### Private protocol #####################################################
+
+    def _refill(self):
+        """ Add the tokens refilled since the last update. """
+
+        now = self._clock()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+        return
+
+
+class RateLimiter(object):
+    """ Paces stanzas using a global bucket and optional per-user buckets.
+
+    ``limit`` and ``per_user_limit`` are (stanzas, seconds) tuples.  A
+    ``per_user_limit`` of None turns off the per-user buckets.
+
+    Stanzas are either sent from the calling thread after waiting for a
+    token (:meth:`wait`), or handed over to a pacer thread (:meth:`submit`).
+    The pacer sends the stanzas of each user in order, but a user who is
+    over their limit doesn't hold up the stanzas of other users: their
+    stanzas are set aside until they have a token, and a global token is
+    only taken when a stanza is sent.  Per-user buckets that are full, and
+    so no different from new ones, are dropped from time to time.
+
+    """
+
+    def __init__(self, limit, per_user_limit=None, log=None):
+        self.log = log if log is not None else logging.getLogger(__name__)
+        self.limit = limit
+        self.per_user_limit = per_user_limit
+
+        self.count = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+        self._bucket = TokenBucket(*limit)
+        self._user_buckets = {}
+        self._pruned = time.time()
+        self._lock = threading.Lock()
+
+        # Stanzas of each user, and a heap of (ready time, order, user) for
+        # the users with stanzas to send
+        self._pending = {}
+        self._ready = []
+        self._order = itertools.count()
+        self._queued = 0
+        self._condition = threading.Condition(threading.Lock())
+        self._thread = None
+
+    def __repr__(self):
+        return (
+            '<RateLimiter: %(count)d stanza(s), %(queued)d queued, '
+            'avg wait %(average_wait).3fs, max wait %(max_wait).3fs>'
+            % self.stats
+        )
+
+    #### 'RateLimiter' protocol ###############################################
+
+    def flush(self):
+        """ Block until all the submitted stanzas have been sent. """
+
+        with self._condition:
+            while self._queued > 0:
+                self._condition.wait()
+
+        return
+
+    @property
+    def stats(self):
+        """ Stats of the time stanzas spent waiting for a token. """
+
+        return {
+            'count': self.count,
+            'queued': self._queued,
+            'total_wait': self.total_wait,
+            'average_wait': (
+                self.total_wait / self.count if self.count else 0.0
+            ),
+            'max_wait': self.max_wait,
+            'user_buckets': len(self._user_buckets),
+        }
+
+    def submit(self, user, send, *args):
+        """ Call send with the args, once a token is available for user.
+
+        Returns immediately; the stanzas of a user are sent in the order of
+        submission.
+
+        """
+
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._pace)
+                    self._thread.daemon = True
+                    self._thread.start()
+
+        with self._condition:
+            stanzas = self._pending.get(user)
+            if stanzas is None:
+                stanzas = self._pending[user] = deque()
+                heapq.heappush(self._ready, (0, next(self._order), user))
+
+            stanzas.append((time.time(), send, args))
+            self._queued += 1
+            self._condition.notify_all()
+
+        return
+
+    def wait(self, user=None, queued_at=None):
+        """ Block until a token is available for user.
+
+        Returns the total time spent waiting since the stanza was queued.
+
+        """
+
+        delay = 0.0
+
+        if user is not None and self.per_user_limit is not None:
+            delay = self._get_user_bucket(user).reserve()
+            if delay > 0:
+                time.sleep(delay)
+
+        global_delay = self._bucket.reserve()
+        if global_delay > 0:
+            time.sleep(global_delay)
+        delay += global_delay
+
+        waited = time.time() - queued_at if queued_at is not None else delay
+        self._record(waited)
+
+        return waited
+
+    #### Private protocol #####################################################
+
+    def _get_user_bucket(self, user):
+        with self._lock:
+            bucket = self._user_buckets.get(user)
+            if bucket is None:
+                self._prune()
+                bucket = TokenBucket(*self.per_user_limit)
+                self._user_buckets[user] = bucket
+
+        return bucket
+
+    def _next(self):
+        """ Wait for the next stanza that can be sent, and take its tokens.
+
+        """
+
+        with self._condition:
+            while True:
+                if len(self._ready) == 0:
+                    self._condition.wait()
+                    continue
+
+                ready_at, order, user = self._ready[0]
+                now = time.time()
+                if ready_at > now:
+                    self._condition.wait(ready_at - now)
+                    continue
+
+                if self.per_user_limit is not None:
+                    delay = self._get_user_bucket(user).delay()
+                    if delay > 0:
+                        heapq.heapreplace(
+                            self._ready, (now + delay, order, user)
+                        )
+                        continue
+
+                delay = self._bucket.delay()
+                if delay > 0:
+                    self._condition.wait(delay)
+                    continue
+
+                break
+
+            self._bucket.reserve()
+            if self.per_user_limit is not None:
+                self._get_user_bucket(user).reserve()
+
+            stanzas = self._pending[user]
+            queued_at, send, args = stanzas.popleft()
+            if len(stanzas) > 0:
+                heapq.heapreplace(self._ready, (now, next(self._order), user))
+
+            else:
+                heapq.heappop(self._ready)
+                del self._pending[user]
+
+        return queued_at, user, send, args
+
+    def _pace(self):
+        while True:
+            queued_at, user, send, args = self._next()
+            try:
+                self._record(time.time() - queued_at)
+                send(*args)
+
+            except Exception:
+                self.log.exception('Failed to send stanza to %s', user)
+
+            finally:
+                with self._condition:
+                    self._queued -= 1
+                    self._condition.notify_all()
+
+    def _prune(self):
+        """ Drop the full per-user buckets, once every period of the limit.
+
+        Must be called with the lock held.
+
+        """
+
+        now = time.time()
+        if now - self._pruned < self.per_user_limit[1]:
+            return
+
+        for user, bucket in self._user_buckets.items():
+            if bucket.full and user not in self._pending:
+                del self._user_buckets[user]
+
+        self._pruned = now
+
+        return
+
+    def _record(self, waited):
+        with self._lock:
+            self.count += 1
+            self.total_wait += waited
+            self.max_wait = max(self.max_wait, waited)
+
+        if waited > 1:
+            self.log.info('Stanza waited %.3fs to be sent', waited)
+
+        return
+
+#### EOF ######################################################################
@@ -0,0 +1,193 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" A scheduler to run the idle hooks and other jobs at their own intervals.
+
+"""
+
+# Standard library
+import logging
+import random
+import threading
+import time
+
+# Project library
+from park.executor import HookExecutor, hook_name
+
+#: Cron-like aliases for intervals.
+ALIASES = {
+    '@minutely': 60,
+    '@hourly': 60 * 60,
+    '@daily': 24 * 60 * 60,
+    '@weekly': 7 * 24 * 60 * 60,
+}
+
+
+def parse_interval(interval):
+    """ Return the interval in seconds, given seconds or an alias. """
+
+    if isinstance(interval, basestring):
+        if interval not in ALIASES:
+            raise ValueError('Unknown interval %s' % interval)
+        interval = ALIASES[interval]
+
+    if interval <= 0:
+        raise ValueError('Interval needs to be positive')
+
+    return interval
+
+
+class Scheduler(object):
+    """ Runs functions periodically, each at an interval of its own.
+
+    The functions are run concurrently, in the worker pools of the given
+    :class:`park.executor.HookExecutor`.  A run that is due while the
+    previous run of the function hasn't finished is skipped, and counted as
+    an overrun.
+
+    """
+
+    def __init__(self, executor=None, log=None):
+        self.log = log if log is not None else logging.getLogger(__name__)
+        self.executor = (
+            executor if executor is not None else HookExecutor(1, log=self.log)
+        )
+
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+
+    def __repr__(self):
+        return '<Scheduler: %s>' % ', '.join(
+            '%s every %ss (%d runs, %d overruns)' % (
+                name, entry.interval, entry.runs, entry.overruns
+            )
+            for name, entry in sorted(self._entries.items())
+        )
+
+    #### 'Scheduler' protocol #################################################
+
+    def add(self, function, interval, args=(), jitter=0.1, name=None):
+        """ Call function(*args) every interval seconds (or alias), from now.
+
+        ``jitter`` is the fraction of the interval by which each run may be
+        randomly delayed.  Adding a function with the name of an existing
+        one replaces it.
+
+        """
+
+        if name is None:
+            name = hook_name(function)
+
+        entry = _Entry(name, function, args, parse_interval(interval), jitter)
+
+        with self._lock:
+            self._entries[name] = entry
+
+        self._wakeup.set()
+
+        return
+
+    def remove(self, name):
+        """ Stop running the function with the given name. """
+
+        with self._lock:
+            self._entries.pop(name, None)
+
+        return
+
+    def run(self):
+        """ Run the due functions until stopped, sleeping in between. """
+
+        while not self._stopped:
+            self._wakeup.clear()
+            now = time.time()
+
+            with self._lock:
+                entries = self._entries.values()
+
+            for entry in entries:
+                if entry.next_run <= now:
+                    self._run_entry(entry, now)
+
+            with self._lock:
+                next_run = min(
+                    [entry.next_run for entry in self._entries.values()] or
+                    [now + 60]
+                )
+
+            self._wakeup.wait(max(0, next_run - time.time()))
+
+        return
+
+    @property
+    def stats(self):
+        """ Runs, overruns and last durations of each function. """
+
+        return dict(
+            (name, {
+                'interval': entry.interval,
+                'runs': entry.runs,
+                'overruns': entry.overruns,
+                'last_duration': entry.last_duration,
+                'next_run': entry.next_run,
+            })
+            for name, entry in self._entries.items()
+        )
+
+    def stop(self):
+        """ Stop running the scheduler. """
+
+        self._stopped = True
+        self._wakeup.set()
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _run_entry(self, entry, now):
+        """ Submit a run of the entry, unless the previous one is running. """
+
+        jitter = random.uniform(0, entry.jitter * entry.interval)
+        entry.next_run = now + entry.interval + jitter
+
+        if entry.job is not None and not entry.job.done:
+            entry.overruns += 1
+            self.log.warning(
+                '%s is still running, skipping a run (%d overruns)',
+                entry.name, entry.overruns
+            )
+            return
+
+        entry.runs += 1
+        entry.job = self.executor.submit_in(entry.function, self._timed, entry)
+
+        return
+
+    def _timed(self, entry):
+        started = time.time()
+        try:
+            return entry.function(*entry.args)
+
+        finally:
+            entry.last_duration = time.time() - started
+
+
+class _Entry(object):
+    """ A function scheduled to run periodically. """
+
+    def __init__(self, name, function, args, interval, jitter):
+        self.name = name
+        self.function = function
+        self.args = args
+        self.interval = interval
+        self.jitter = jitter
+        self.next_run = 0
+        self.runs = 0
+        self.overruns = 0
+        self.last_duration = None
+        self.job = None
+
+#### EOF ######################################################################
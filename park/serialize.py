@@ -5,8 +5,13 @@
 """ Utilities for serializing and de-serializing the bot. """
 
 # Standard library.
+import copy
 import json
-from os.path import exists
+import logging
+import os
+from os.path import abspath, basename, dirname, exists
+import tempfile
+import threading
 
 
 def read_state(path):
@@ -25,9 +30,140 @@ def read_state(path):
 
 
 def save_state(path, state):
-    """ Save the given state to the given path. """
+    """ Save the given state to the given path.
 
-    with open(path, 'w') as f:
-        json.dump(state, f, indent=2)
+    The state is written to a temporary file which is then renamed to the
+    path, so that a crash never leaves a truncated file behind.
+
+    """
+
+    fd, temp_path = tempfile.mkstemp(
+        prefix='.%s.' % basename(path), dir=dirname(abspath(path))
+    )
+
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(state, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+
+        os.chmod(temp_path, os.stat(path).st_mode if exists(path) else 0644)
+        os.rename(temp_path, path)
+
+    except Exception:
+        if exists(temp_path):
+            os.remove(temp_path)
+        raise
 
     return
+
+
+class StateStore(object):
+    """ The state saved in a storage namespace, kept in memory.
+
+    The state is a dict of sections, each saved as a key of the namespace
+    in a :class:`park.storage.Storage`.  Updating sections with unchanged
+    values doesn't cause a write, and the writes for a burst of updates are
+    coalesced into one, at most ``delay`` seconds after the first update.
+    With no delay, changes are written right away.  Only the changed
+    sections are written.
+
+    """
+
+    def __init__(self, storage, namespace='state', delay=0, log=None):
+        self.log = log if log is not None else logging.getLogger(__name__)
+        self.storage = storage
+        self.namespace = namespace
+        self.delay = delay
+        self.writes = 0
+
+        self._state = None
+        self._encoded = {}
+        self._dirty = set()
+        self._lock = threading.RLock()
+        self._timer = None
+
+    def __repr__(self):
+        return '<StateStore %s: %d dirty section(s), %d write(s)>' % (
+            self.namespace, len(self._dirty), self.writes
+        )
+
+    #### 'StateStore' protocol ################################################
+
+    @property
+    def dirty(self):
+        """ The names of sections changed since the last write. """
+
+        return set(self._dirty)
+
+    def flush(self):
+        """ Write the state now, if anything changed since the last write. """
+
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if not self._dirty:
+                return
+
+            self.log.debug(
+                'Saving %s, changed: %s', self.namespace,
+                ', '.join(sorted(self._dirty))
+            )
+            with self.storage.transaction():
+                for name in self._dirty:
+                    self.storage.set(self.namespace, name, self._state[name])
+            self._dirty.clear()
+            self.writes += 1
+
+        return
+
+    def read(self):
+        """ Return a copy of the state, including the unwritten changes. """
+
+        with self._lock:
+            return copy.deepcopy(self._load())
+
+    def update(self, sections):
+        """ Update the given sections of the state, and schedule a write. """
+
+        with self._lock:
+            state = self._load()
+
+            for name, value in sections.iteritems():
+                encoded = json.dumps(value, sort_keys=True)
+                if self._encoded.get(name) != encoded:
+                    state[name] = json.loads(encoded)
+                    self._encoded[name] = encoded
+                    self._dirty.add(name)
+
+            if not self._dirty:
+                # Nothing changed, and nothing to write.
+                return
+
+            if self.delay <= 0:
+                self.flush()
+
+            elif self._timer is None:
+                self._timer = threading.Timer(self.delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _load(self):
+        """ Load the state from the storage, the first time it is needed. """
+
+        if self._state is None:
+            self._state = dict(self.storage.items(self.namespace))
+            self._encoded = dict(
+                (name, json.dumps(value, sort_keys=True))
+                for name, value in self._state.iteritems()
+            )
+
+        return self._state
+
+#### EOF ######################################################################
@@ -0,0 +1,232 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" A persistent queue of jobs on disk, handled in the background. """
+
+# Standard library
+import logging
+import os
+from os.path import exists, join
+import threading
+import time
+import uuid
+
+# Project library
+from park.serialize import read_state, save_state
+
+#: Statuses of the jobs in the spool.
+QUEUED = 'queued'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class Rejected(Exception):
+    """ Raised by handlers for jobs that shouldn't be retried. """
+
+
+class Spool(object):
+    """ Jobs saved as files in a directory, handled by a worker thread.
+
+    Each job is an item (anything JSON serializable) that is passed to the
+    ``handler``.  Jobs whose handler raises an exception are retried with
+    exponential backoff, starting at ``backoff`` seconds, and are given up
+    after ``max_attempts`` (or right away, if the handler raises
+    :class:`Rejected`), when ``failed`` (if given) is called with the
+    item and the errors.  Handled jobs are moved to the ``done`` or the
+    ``failed`` sub-directory, with the status, the number of attempts and
+    the errors.  Jobs still queued when the bot stops are handled when the
+    spool is started again.
+
+    """
+
+    def __init__(self, directory, handler, name='spool', max_attempts=8,
+                 backoff=30, max_backoff=6 * 60 * 60, failed=None,
+                 log=None):
+        self.log = log if log is not None else logging.getLogger(__name__)
+        self.directory = directory
+        self.handler = handler
+        self.name = name
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failed = failed
+
+        for status in (DONE, FAILED):
+            path = join(directory, status)
+            if not exists(path):
+                os.makedirs(path)
+
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = None
+
+    def __repr__(self):
+        return '<Spool %s: %d pending>' % (self.name, self.pending)
+
+    #### 'Spool' protocol #####################################################
+
+    @property
+    def pending(self):
+        """ The number of jobs waiting to be handled. """
+
+        return len(self._list())
+
+    def process(self):
+        """ Handle all the jobs that are due, and return the next due time.
+
+        Returns None if there are no more jobs.
+
+        """
+
+        with self._lock:
+            next_attempt = None
+
+            for job_id in self._list():
+                path = join(self.directory, job_id)
+                job = read_state(path)
+                if not job:
+                    continue
+
+                if job['next_attempt'] <= time.time():
+                    job = self._handle(job_id, job)
+
+                if job['status'] == QUEUED and (
+                    next_attempt is None or job['next_attempt'] < next_attempt
+                ):
+                    next_attempt = job['next_attempt']
+
+        return next_attempt
+
+    def put(self, item):
+        """ Save a job to handle the item, and return the id of the job. """
+
+        job_id = '%.6f-%s.json' % (time.time(), uuid.uuid4().hex)
+        job = {
+            'item': item,
+            'status': QUEUED,
+            'attempts': 0,
+            'next_attempt': 0,
+            'errors': [],
+        }
+        save_state(join(self.directory, job_id), job)
+        self._wakeup.set()
+
+        return job_id
+
+    def start(self):
+        """ Start the worker thread, if it isn't already running. """
+
+        with self._lock:
+            if self._thread is None:
+                self._stopped = False
+                self._thread = threading.Thread(
+                    target=self._work, name=self.name
+                )
+                self._thread.daemon = True
+                self._thread.start()
+
+        return
+
+    def status(self, job_id):
+        """ Return the saved job, with its status, or None. """
+
+        for status in ('', DONE, FAILED):
+            path = join(self.directory, status, job_id)
+            if exists(path):
+                return read_state(path)
+
+        return None
+
+    def stop(self):
+        """ Stop the worker thread, after the job being handled. """
+
+        self._stopped = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _handle(self, job_id, job):
+        """ Handle the job, and save or move it, based on the result. """
+
+        path = join(self.directory, job_id)
+        job['attempts'] += 1
+
+        try:
+            self.handler(job['item'])
+
+        except Exception as e:
+            self.log.exception(
+                '%s: attempt %d of %s failed', self.name, job['attempts'],
+                job_id
+            )
+            job['errors'].append('%s: %s' % (e.__class__.__name__, e))
+            delay = min(
+                self.max_backoff, self.backoff * 2 ** (job['attempts'] - 1)
+            )
+            job['next_attempt'] = time.time() + delay
+            if isinstance(e, Rejected) or job['attempts'] >= self.max_attempts:
+                job['status'] = FAILED
+                self._give_up(job_id, job)
+
+        else:
+            job['status'] = DONE
+
+        job['updated'] = time.time()
+
+        if job['status'] == QUEUED:
+            save_state(path, job)
+
+        else:
+            save_state(join(self.directory, job['status'], job_id), job)
+            os.remove(path)
+
+        return job
+
+    def _give_up(self, job_id, job):
+        """ Call the ``failed`` callback for a job that is given up. """
+
+        if self.failed is None:
+            return
+
+        try:
+            self.failed(job['item'], job['errors'])
+
+        except Exception:
+            self.log.exception('%s: failed callback of %s', self.name, job_id)
+
+        return
+
+    def _list(self):
+        """ Return the ids of the queued jobs, oldest first. """
+
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if name.endswith('.json')
+        )
+
+    def _work(self):
+        while not self._stopped:
+            self._wakeup.clear()
+            try:
+                next_attempt = self.process()
+
+            except Exception:
+                self.log.exception('Error processing %s', self.name)
+                next_attempt = time.time() + self.backoff
+
+            timeout = (
+                None if next_attempt is None
+                else max(0, next_attempt - time.time())
+            )
+            self._wakeup.wait(timeout)
+
+        return
+
+#### EOF ######################################################################
@@ -0,0 +1,330 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Key-value storage for the bot and plugins, in JSON files or SQLite.
+
+Data is stored as JSON-serializable values, under string keys, in
+namespaces.  The bot's state is the ``state`` namespace, and plugins are
+expected to use a namespace of their own.
+
+"""
+
+# Standard library
+from contextlib import contextmanager
+import json
+import logging
+from os.path import join
+import sqlite3
+import threading
+
+# Project library
+from park.serialize import read_state, save_state
+
+#: Names of the storage backends.
+JSON = 'json'
+SQLITE = 'sqlite'
+BACKENDS = (JSON, SQLITE)
+
+#: Name of the SQLite database file, in the bot's root.
+SQLITE_DB_NAME = 'park.sqlite'
+
+#: JSON files that are migrated into the SQLite database, by namespace.
+MIGRATED_NAMESPACES = ('state',)
+
+#: Namespace for data about the storage itself, like completed migrations.
+META_NAMESPACE = '_meta'
+
+
+class Storage(object):
+    """ The interface of the storage backends.
+
+    All the methods are thread-safe.  Changes made inside a
+    :meth:`transaction` are saved together when the outermost transaction
+    ends, or discarded if it ends with an exception.
+
+    """
+
+    def __init__(self):
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    #### 'Storage' protocol ###################################################
+
+    def close(self):
+        """ Release any resources held by the storage. """
+
+        return
+
+    def delete(self, namespace, key):
+        """ Delete the value of the key, if it exists. """
+
+        raise NotImplementedError
+
+    def get(self, namespace, key, default=None):
+        """ Return the value of the key, or the default. """
+
+        raise NotImplementedError
+
+    def items(self, namespace):
+        """ Return a list of all the (key, value) pairs in the namespace. """
+
+        raise NotImplementedError
+
+    def set(self, namespace, key, value):
+        """ Set the value of the key. """
+
+        raise NotImplementedError
+
+    @contextmanager
+    def transaction(self):
+        """ A context manager to make a group of changes atomically. """
+
+        with self._lock:
+            if self._depth == 0:
+                self._begin()
+
+            self._depth += 1
+            try:
+                yield self
+
+            except Exception:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._rollback()
+                raise
+
+            else:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._commit()
+
+    #### Private protocol #####################################################
+
+    def _begin(self):
+        return
+
+    def _commit(self):
+        return
+
+    def _rollback(self):
+        return
+
+
+class JSONStorage(Storage):
+    """ Stores each namespace as a JSON object in ``<namespace>.json``.
+
+    The files are written atomically, once for each change, or once at the
+    end of a transaction.  The ``state`` namespace is the ``state.json``
+    file that the bot has always used.
+
+    """
+
+    def __init__(self, directory):
+        super(JSONStorage, self).__init__()
+        self.directory = directory
+
+        self._documents = {}
+        self._dirty = set()
+
+    def __repr__(self):
+        return '<JSONStorage %s>' % self.directory
+
+    #### 'Storage' protocol ###################################################
+
+    def delete(self, namespace, key):
+        with self._lock:
+            document = self._load(namespace)
+            if key in document:
+                del document[key]
+                self._changed(namespace)
+
+        return
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            return self._load(namespace).get(key, default)
+
+    def items(self, namespace):
+        with self._lock:
+            return self._load(namespace).items()
+
+    def path(self, namespace):
+        """ Return the path of the file for the namespace. """
+
+        return join(self.directory, '%s.json' % namespace)
+
+    def set(self, namespace, key, value):
+        with self._lock:
+            self._load(namespace)[key] = value
+            self._changed(namespace)
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _changed(self, namespace):
+        self._dirty.add(namespace)
+        if self._depth == 0:
+            self._commit()
+
+        return
+
+    def _commit(self):
+        for namespace in self._dirty:
+            save_state(self.path(namespace), self._documents[namespace])
+        self._dirty.clear()
+
+        return
+
+    def _load(self, namespace):
+        """ Return the document of the namespace, reading it if required. """
+
+        document = self._documents.get(namespace)
+
+        if document is None:
+            document = read_state(self.path(namespace))
+            if not isinstance(document, dict):
+                raise ValueError('%s is not a JSON object' % namespace)
+            self._documents[namespace] = document
+
+        return document
+
+    def _rollback(self):
+        for namespace in self._dirty:
+            self._documents.pop(namespace, None)
+        self._dirty.clear()
+
+        return
+
+
+class SQLiteStorage(Storage):
+    """ Stores all the namespaces in one table of an SQLite database.
+
+    The database is used in WAL mode, and each change only updates the
+    row of its key.
+
+    """
+
+    def __init__(self, path):
+        super(SQLiteStorage, self).__init__()
+        self.path = path
+
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS data ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, '
+            'PRIMARY KEY (namespace, key))'
+        )
+
+    def __repr__(self):
+        return '<SQLiteStorage %s>' % self.path
+
+    #### 'Storage' protocol ###################################################
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+        return
+
+    def delete(self, namespace, key):
+        self._execute(
+            'DELETE FROM data WHERE namespace = ? AND key = ?',
+            (namespace, key)
+        )
+
+        return
+
+    def get(self, namespace, key, default=None):
+        rows = self._execute(
+            'SELECT value FROM data WHERE namespace = ? AND key = ?',
+            (namespace, key)
+        )
+
+        return json.loads(rows[0][0]) if rows else default
+
+    def items(self, namespace):
+        rows = self._execute(
+            'SELECT key, value FROM data WHERE namespace = ?', (namespace,)
+        )
+
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def set(self, namespace, key, value):
+        self._execute(
+            'INSERT OR REPLACE INTO data (namespace, key, value) '
+            'VALUES (?, ?, ?)',
+            (namespace, key, json.dumps(value))
+        )
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _begin(self):
+        self._connection.execute('BEGIN IMMEDIATE')
+
+    def _commit(self):
+        self._connection.execute('COMMIT')
+
+    def _execute(self, query, parameters):
+        with self._lock:
+            return self._connection.execute(query, parameters).fetchall()
+
+    def _rollback(self):
+        self._connection.execute('ROLLBACK')
+
+
+def migrate(source, target, namespaces):
+    """ Copy all the data in the namespaces from one storage to another. """
+
+    with target.transaction():
+        for namespace in namespaces:
+            for key, value in source.items(namespace):
+                target.set(namespace, key, value)
+
+    return
+
+
+def open_storage(backend, root, log=None):
+    """ Return the storage of the given backend, for the bot's root.
+
+    Until the data in the JSON files is migrated into the SQLite database,
+    it is migrated when the database is opened.  A marker is saved along
+    with the migrated data, so that an interrupted migration is done again.
+    The JSON files are left as they are.
+
+    """
+
+    log = log if log is not None else logging.getLogger(__name__)
+
+    if backend == JSON:
+        return JSONStorage(root)
+
+    elif backend != SQLITE:
+        raise ValueError('Unknown storage backend %s' % backend)
+
+    path = join(root, SQLITE_DB_NAME)
+    storage = SQLiteStorage(path)
+
+    if storage.get(META_NAMESPACE, 'migrated') is None:
+        with storage.transaction():
+            # Databases created before the marker was saved already have data
+            if not any(map(storage.items, MIGRATED_NAMESPACES)):
+                log.info(
+                    'Migrating %s to %s', ', '.join(MIGRATED_NAMESPACES), path
+                )
+                migrate(JSONStorage(root), storage, MIGRATED_NAMESPACES)
+
+            storage.set(
+                META_NAMESPACE, 'migrated', list(MIGRATED_NAMESPACES)
+            )
+
+    return storage
+
+#### EOF ######################################################################
@@ -0,0 +1,101 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the caches. """
+
+# Standard library
+import shutil
+import tempfile
+import unittest
+
+# Project library
+from park.cache import Cache, StorageCache
+from park.storage import JSONStorage
+
+
+class TestCache(unittest.TestCase):
+    """ Tests for the caches. """
+
+    def setUp(self):
+        self.now = 0
+
+    def test_should_evict_least_recently_used(self):
+        # Given
+        cache = Cache(size=2)
+        cache.set('a', 1)
+        cache.set('b', 2)
+
+        # When
+        cache.get('a')
+        cache.set('c', 3)
+
+        # Then
+        self.assertEqual(1, cache.get('a'))
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(
+            {'entries': 2, 'size': 2, 'hits': 2, 'misses': 1, 'evictions': 1},
+            cache.stats
+        )
+
+        return
+
+    def test_should_expire_entries_after_ttl(self):
+        # Given
+        cache = Cache(ttl=10, clock=lambda: self.now)
+        cache.set('a', 1)
+
+        # When
+        self.now = 10
+
+        # Then
+        self.assertNotIn('a', cache)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(1, cache.peek('a'))
+
+        return
+
+    def test_should_load_entries_from_storage(self):
+        # Given
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        storage = JSONStorage(tempdir)
+        cache = StorageCache(storage, 'cache', size=2, clock=lambda: self.now)
+        for i, key in enumerate('abc'):
+            cache.set(key, i)
+
+        # When
+        cache = StorageCache(storage, 'cache', size=2)
+
+        # Then
+        self.assertEqual(2, len(cache))
+        self.assertEqual(2, cache.get('c'))
+        self.assertEqual(['b', 'c'], sorted(dict(storage.items('cache'))))
+
+        return
+
+    def test_should_write_changes_together(self):
+        # Given
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        storage = JSONStorage(tempdir)
+        cache = StorageCache(storage, 'cache', size=2, delay=60)
+
+        # When
+        for i, key in enumerate('abc'):
+            cache.set(key, i)
+        unsaved = storage.items('cache')
+        cache.flush()
+
+        # Then
+        self.assertEqual([], unsaved)
+        self.assertEqual(1, cache.writes)
+        self.assertEqual(['b', 'c'], sorted(dict(storage.items('cache'))))
+
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
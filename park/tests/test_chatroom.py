@@ -77,6 +77,33 @@ class TestChatRoom(unittest.TestCase):
 
         return
 
+    def test_should_replay_journal_after_crash(self):
+        # Given
+        bot = ChatRoomJabberBot(self.jid, self.password, root=self.tempdir)
+        foo = 'foo@foo.com'
+        bot.users = {foo: 'foo', 'bar@bar.com': 'bar'}
+        bot.alias(xmpp.Message(frm=foo, typ='chat'), 'bazooka')
+
+        # When
+        restarted = ChatRoomJabberBot(
+            self.jid, self.password, root=self.tempdir
+        )
+
+        # Then
+        self.assertFalse(exists(bot.db))
+        self.assertDictEqual(bot.users, restarted.users)
+
+        # When
+        restarted.shutdown()
+
+        # Then
+        self.assertEqual([], restarted.journal.read())
+        self.assertDictEqual(
+            bot.users, serialize.read_state(bot.db)['users']
+        )
+
+        return
+
     #### Test bot commands ####################################################
 
     def test_should_not_send_message_from_unsubscribed_user(self):
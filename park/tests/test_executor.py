@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the pools of worker threads. """
+
+# Standard library
+import threading
+import unittest
+
+# Project library
+from park.executor import HookExecutor, WorkerPool
+
+
+def message_processor(bot, user, text):
+    return threading.current_thread().name
+
+
+class TestExecutor(unittest.TestCase):
+    """ Tests for the pools of worker threads. """
+
+    def test_should_reuse_threads_of_pool(self):
+        # Given
+        pool = WorkerPool(size=2, name='test')
+        started = []
+        both_busy = threading.Event()
+
+        def wait_for_both():
+            started.append(threading.current_thread())
+            if len(started) == 2:
+                both_busy.set()
+            both_busy.wait(5)
+
+            return threading.current_thread()
+
+        # When
+        jobs = [pool.submit(wait_for_both) for _ in range(2)] + [
+            pool.submit(threading.current_thread) for _ in range(8)
+        ]
+        pool.join()
+
+        # Then
+        self.assertEqual(2, len(set(job.result for job in jobs)))
+        self.assertEqual(0, pool.depth)
+
+        return
+
+    def test_should_save_exception_of_job(self):
+        # Given
+        pool = WorkerPool(name='test')
+
+        # When
+        job = pool.submit(int, 'foo')
+        job.wait()
+
+        # Then
+        self.assertTrue(job.done)
+        self.assertIsInstance(job.exception, ValueError)
+
+        return
+
+    def test_should_run_hooks_in_pools_of_their_own(self):
+        # Given
+        name = '%s.message_processor' % __name__
+        executor = HookExecutor(size=2, sizes={name: 1})
+
+        # When
+        jobs = [
+            executor.submit(message_processor, None, 'foo', 'bar')
+            for _ in range(5)
+        ]
+        [job.wait() for job in jobs]
+
+        # Then
+        self.assertEqual(
+            ['%s-0' % name], list(set(job.result for job in jobs))
+        )
+        self.assertEqual({name: 0}, executor.depth)
+
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
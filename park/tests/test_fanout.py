@@ -0,0 +1,87 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the fan-out of broadcast messages. """
+
+# Standard library
+import threading
+import unittest
+
+# Project library
+from park.fanout import FanOut
+
+
+class TestFanOut(unittest.TestCase):
+    """ Tests for the fan-out of broadcast messages. """
+
+    def setUp(self):
+        self.sent = []
+        self.lock = threading.Lock()
+
+    def test_should_send_highlighted_message_to_others(self):
+        # Given
+        fanout = FanOut(self._send, threaded=False)
+        users = {'foo@foo.com': 'foo', 'bar@bar.com': 'bar'}
+
+        # When
+        fanout.broadcast(['[foo]: hello bar'], users)
+
+        # Then
+        self.assertEqual([('bar@bar.com', '[foo]: hello *bar*')], self.sent)
+        self.assertEqual(1, fanout.stats['count'])
+
+        return
+
+    def test_should_preserve_order_per_recipient_in_threads(self):
+        # Given
+        fanout = FanOut(self._send, workers=3)
+        users = dict(('user%s@foo.com' % i, 'user%s' % i) for i in range(10))
+        messages = ['message %s' % i for i in range(20)]
+
+        # When
+        for message in messages:
+            fanout.broadcast([message], users)
+        fanout.flush()
+
+        # Then
+        self.assertEqual(20 * 10, len(self.sent))
+        for user in users:
+            received = [body for to, body in self.sent if to == user]
+            self.assertEqual(messages, received)
+        self.assertEqual(20, fanout.stats['count'])
+
+        return
+
+    def test_should_coalesce_messages_per_recipient(self):
+        # Given
+        fanout = FanOut(self._send, threaded=False, limit=30)
+        users = {'foo@foo.com': 'foo', 'bar@bar.com': 'bar'}
+        messages = ['[foo]: hi bar', '[bar]: hi foo', '', '[foo]: bye']
+
+        # When
+        fanout.broadcast(messages, users)
+
+        # Then
+        self.assertEqual(
+            [('bar@bar.com', '[foo]: hi *bar*\n[foo]: bye')],
+            [(to, body) for to, body in self.sent if to == 'bar@bar.com']
+        )
+        self.assertEqual(
+            [('foo@foo.com', '[bar]: hi *foo*')],
+            [(to, body) for to, body in self.sent if to == 'foo@foo.com']
+        )
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _send(self, user, body):
+        with self.lock:
+            self.sent.append((user, body))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
@@ -0,0 +1,70 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the journal of changes to the state. """
+
+# Standard library
+from os.path import join
+import shutil
+import tempfile
+import unittest
+
+# Project library
+from park.journal import Journal
+
+
+class TestJournal(unittest.TestCase):
+    """ Tests for the journal of changes to the state. """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = join(self.tempdir, 'journal.jsonl')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_should_ignore_partially_written_record(self):
+        # Given
+        journal = Journal(self.path)
+        journal.append({'topic': 'parks'})
+        journal.close()
+        with open(self.path, 'a') as f:
+            f.write('{"topic": "pla')
+
+        # When
+        records = Journal(self.path).read()
+        journal = Journal(self.path)
+        journal.append({'topic': 'playgrounds'})
+        journal.close()
+
+        # Then
+        self.assertEqual([{'topic': 'parks'}], records)
+        self.assertEqual(
+            [{'topic': 'parks'}, {'topic': 'playgrounds'}],
+            Journal(self.path).read()
+        )
+
+        return
+
+    def test_should_drop_records_on_compaction(self):
+        # Given
+        journal = Journal(self.path)
+        journal.append({'topic': 'parks'})
+        snapshots = []
+
+        # When
+        journal.compact(lambda: snapshots.append(journal.read()))
+        journal.append({'topic': 'playgrounds'})
+
+        # Then
+        self.assertEqual([[{'topic': 'parks'}]], snapshots)
+        self.assertEqual([{'topic': 'playgrounds'}], journal.read())
+
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
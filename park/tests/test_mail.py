@@ -0,0 +1,156 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the delivery of emails. """
+
+# Standard library
+import asyncore
+from email import message_from_string
+import shutil
+import smtpd
+import tempfile
+import threading
+import unittest
+
+# Project library
+from park import util
+from park.mail import MailTransport
+from park.spool import Spool
+
+
+class TestMail(unittest.TestCase):
+    """ Tests for the delivery of emails. """
+
+    def setUp(self):
+        self.server = _Server(('127.0.0.1', 0), None)
+        self.port = self.server.socket.getsockname()[1]
+        thread = threading.Thread(
+            target=asyncore.loop, kwargs={'timeout': 0.1}
+        )
+        thread.daemon = True
+        thread.start()
+
+    def tearDown(self):
+        self.server.close()
+
+    def test_should_reuse_connection(self):
+        # Given
+        transport = MailTransport('127.0.0.1', self.port, starttls=False)
+
+        # When
+        for i in range(3):
+            transport.send('park@foo.com', ['bar@bar.com'], 'Hi %s' % i)
+        transport.close()
+
+        # Then
+        self.assertEqual(1, self.server.connections)
+        self.assertEqual(
+            ['Hi 0', 'Hi 1', 'Hi 2'],
+            [data for _, _, data in self.server.messages]
+        )
+
+        return
+
+    def test_should_reconnect_after_messages_per_connection(self):
+        # Given
+        transport = MailTransport(
+            '127.0.0.1', self.port, starttls=False, per_connection=2
+        )
+
+        # When
+        for i in range(3):
+            transport.send('park@foo.com', ['bar@bar.com'], 'Hi %s' % i)
+        transport.close()
+
+        # Then
+        self.assertEqual(2, self.server.connections)
+        self.assertEqual(2, transport.connections)
+
+        return
+
+    def test_should_send_separate_email_to_each_recipient(self):
+        # Given
+        transport = MailTransport('127.0.0.1', self.port, starttls=False)
+        self._patch(util, '_MAIL_TRANSPORT', transport)
+        spool = self._patch(util, '_MAIL_SPOOL', self._create_spool())
+        to = ['foo@foo.com', 'bar@bar.com']
+
+        # When
+        util.send_email(to, 'Parkly', 'Hello!')
+        queued = spool.pending
+        spool.process()
+        transport.close()
+
+        # Then
+        self.assertEqual(2, queued)
+        self.assertEqual(0, spool.pending)
+        self.assertEqual(
+            [[address] for address in to],
+            [recipients for _, recipients, _ in self.server.messages]
+        )
+        self.assertEqual(
+            to,
+            [
+                message_from_string(data)['To']
+                for _, _, data in self.server.messages
+            ]
+        )
+
+        return
+
+    def test_should_keep_email_queued_until_sent(self):
+        # Given
+        transport = MailTransport('127.0.0.1', 1, starttls=False)
+        self._patch(util, '_MAIL_TRANSPORT', transport)
+        spool = self._patch(util, '_MAIL_SPOOL', self._create_spool(0))
+        util.send_email('foo@foo.com', 'Parkly', 'Hello!')
+
+        # When
+        next_attempt = spool.process()
+        transport.port = self.port
+        spool.process()
+        transport.close()
+
+        # Then
+        self.assertIsNotNone(next_attempt)
+        self.assertEqual(1, len(self.server.messages))
+        self.assertEqual(0, spool.pending)
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _create_spool(self, backoff=30):
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+
+        return Spool(tempdir, util._deliver_email, backoff=backoff)
+
+    def _patch(self, obj, name, value):
+        self.addCleanup(setattr, obj, name, getattr(obj, name))
+        setattr(obj, name, value)
+
+        return value
+
+
+class _Server(smtpd.SMTPServer):
+    """ A local SMTP server that saves the messages it receives. """
+
+    def __init__(self, *args):
+        smtpd.SMTPServer.__init__(self, *args)
+        self.connections = 0
+        self.messages = []
+
+    def handle_accept(self):
+        self.connections += 1
+        smtpd.SMTPServer.handle_accept(self)
+
+    def process_message(self, peer, sender, recipients, data):
+        self.messages.append((sender, recipients, data))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
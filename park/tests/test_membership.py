@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the registry of members. """
+
+# Standard library
+import json
+import unittest
+
+# Project library
+from park.membership import INVITED, SUBSCRIBED, Membership
+
+
+class TestMembership(unittest.TestCase):
+    """ Tests for the registry of members. """
+
+    def test_should_lookup_email_from_nick(self):
+        # Given
+        members = Membership(
+            users={'foo@foo.com': 'foo'}, invited={'bar@bar.com': 'bar'}
+        )
+
+        # When
+        foo = members.get_email('foo')
+        bar = members.get_email('bar')
+
+        # Then
+        self.assertEqual('foo@foo.com', foo)
+        self.assertIsNone(bar)
+        self.assertEqual('bar@bar.com', members.get_email('bar', INVITED))
+
+        return
+
+    def test_should_lookup_members_sharing_a_nick(self):
+        # Given
+        members = Membership(users={'foo@a.com': 'foo'})
+        members.users['foo@b.com'] = 'foo'
+
+        # When
+        first = members.get_email('foo')
+        members.users.pop('foo@a.com')
+        second = members.get_email('foo')
+
+        # Then
+        self.assertEqual('foo@a.com', first)
+        self.assertEqual('foo@b.com', second)
+
+        return
+
+    def test_should_update_indexes_when_dicts_change(self):
+        # Given
+        members = Membership(users={'foo@foo.com': 'foo'})
+        changes = []
+        members.add_listener(changes.extend)
+
+        # When
+        members.users['foo@foo.com'] = 'bazooka'
+        nick = members.users.pop('foo@foo.com')
+        members.invited['foo@foo.com'] = nick
+
+        # Then
+        self.assertIsNone(members.get_email('foo'))
+        self.assertEqual('foo@foo.com', members.get_email('bazooka', INVITED))
+        self.assertEqual({}, members.users)
+        self.assertEqual(INVITED, members.get('foo@foo.com').state)
+        self.assertEqual(
+            [
+                ('foo@foo.com', 'bazooka', SUBSCRIBED),
+                ('foo@foo.com', 'bazooka', None),
+                ('foo@foo.com', 'bazooka', INVITED),
+            ],
+            changes
+        )
+
+        return
+
+    def test_should_serialize_to_same_shape(self):
+        # Given
+        users = {'foo@foo.com': 'foo'}
+        invited = {'bar@bar.com': 'bar@bar.com'}
+        members = Membership(users=users, invited=invited)
+
+        # When
+        data = json.loads(json.dumps({'users': members.users}))
+
+        # Then
+        self.assertEqual(users, data['users'])
+        self.assertEqual(invited, members.as_dict(INVITED))
+
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
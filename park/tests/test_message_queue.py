@@ -0,0 +1,105 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the outbound message queue. """
+
+# Standard library
+import threading
+import time
+import unittest
+
+# Project library
+from park.message_queue import (
+    BLOCK, DROP_LOW_PRIORITY, DROP_OLDEST, LOW, MessageQueue
+)
+
+
+class TestMessageQueue(unittest.TestCase):
+    """ Tests for the outbound message queue. """
+
+    def test_should_drop_oldest_message_when_full(self):
+        # Given
+        queue = MessageQueue(capacity=2, policy=DROP_OLDEST)
+
+        # When
+        queue.extend(['foo', 'bar', 'baz'])
+
+        # Then
+        self.assertEqual(['bar', 'baz'], queue.drain())
+        self.assertEqual(1, queue.stats['dropped'])
+        self.assertEqual(3, queue.stats['enqueued'])
+
+        return
+
+    def test_should_drop_low_priority_message_when_full(self):
+        # Given
+        queue = MessageQueue(capacity=2, policy=DROP_LOW_PRIORITY)
+        queue.append('foo')
+        queue.append('', priority=LOW)
+
+        # When
+        queue.append('bar')
+        queue.append('', priority=LOW)
+
+        # Then
+        self.assertEqual(['foo', 'bar'], list(queue))
+        self.assertEqual(2, queue.dropped)
+
+        return
+
+    def test_should_block_until_drained(self):
+        # Given
+        queue = MessageQueue(capacity=1, policy=BLOCK, timeout=5)
+        queue.append('foo')
+
+        # When
+        thread = threading.Thread(target=queue.append, args=('bar',))
+        thread.start()
+        drained = []
+        while len(drained) < 2:
+            drained.extend(queue.drain())
+        thread.join()
+
+        # Then
+        self.assertEqual(['foo', 'bar'], drained)
+        self.assertEqual(0, queue.dropped)
+
+        return
+
+    def test_should_drop_new_message_after_blocking_timeout(self):
+        # Given
+        queue = MessageQueue(capacity=1, policy=BLOCK, timeout=0.1)
+        queue.append('foo')
+
+        # When
+        queue.append('bar')
+
+        # Then
+        self.assertEqual(['foo'], list(queue))
+        self.assertEqual(1, queue.dropped)
+
+        return
+
+    def test_should_not_block_in_draining_thread(self):
+        # Given
+        queue = MessageQueue(capacity=1, policy=BLOCK, timeout=5)
+        queue.drain()
+        queue.append('foo')
+
+        # When
+        started = time.time()
+        queue.append('bar')
+
+        # Then
+        self.assertLess(time.time() - started, 1)
+        self.assertEqual(['foo'], list(queue))
+        self.assertEqual(1, queue.dropped)
+
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
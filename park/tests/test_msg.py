@@ -0,0 +1,127 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the msg plugin. """
+
+# Standard library
+from os.path import abspath, dirname, join
+import shutil
+import tempfile
+import unittest
+
+# 3rd party
+import xmpp
+
+# Project library
+from park.chatroom import ChatRoomJabberBot
+from park.membership import INVITED, SUBSCRIBED
+from park.plugins.msg import Mailbox
+from park.storage import JSONStorage
+
+HERE = dirname(abspath(__file__))
+
+
+class TestMsg(unittest.TestCase):
+    """ Tests for leaving messages to users. """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        shutil.copytree(
+            join(HERE, '..', 'plugins'), join(self.tempdir, 'plugins')
+        )
+        shutil.copy(
+            join(HERE, '..', '..', 'sample-settings.py'),
+            join(HERE, '..', 'sample-settings.py')
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_should_deliver_messages_when_user_comes_online(self):
+        # Given
+        bot = self._create_bot()
+        message = xmpp.Message(frm='foo@foo.com', typ='chat')
+        bot.commands[',msg'](message, 'bar hello')
+        bot.commands[',msg'](message, 'bar are you there?')
+
+        # When
+        bot = self._create_bot()
+        bot.status_type_changed(xmpp.JID('bar@bar.com/home'), bot.OFFLINE)
+        offline = list(self.sent)
+        bot.status_type_changed(xmpp.JID('bar@bar.com/home'), bot.AVAILABLE)
+        bot.status_type_changed(xmpp.JID('bar@bar.com/work'), bot.AVAILABLE)
+
+        # Then
+        self.assertEqual([], offline)
+        self.assertEqual(1, len(self.sent))
+        user, text = self.sent[0]
+        self.assertEqual('bar@bar.com', user)
+        self.assertIn('foo -- hello\nfoo -- are you there?', text)
+
+        return
+
+    def test_should_keep_messages_until_user_subscribes(self):
+        # Given
+        bot = self._create_bot()
+        message = xmpp.Message(frm='foo@foo.com', typ='chat')
+        bot.commands[',msg'](message, 'bar hello')
+        bot.members.add('bar@bar.com', 'bar', INVITED)
+
+        # When
+        bot.status_type_changed(xmpp.JID('bar@bar.com/home'), bot.AVAILABLE)
+        kept = list(self.sent)
+        bot.members.add('bar@bar.com', 'bar', SUBSCRIBED)
+        bot.status_type_changed(xmpp.JID('bar@bar.com/home'), bot.DND)
+
+        # Then
+        self.assertEqual([], kept)
+        self.assertEqual(1, len(self.sent))
+        self.assertIn('foo -- hello', self.sent[0][1])
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _create_bot(self):
+        bot = ChatRoomJabberBot(
+            'test@example.com', '********', debug=True, root=self.tempdir
+        )
+        bot.users = {'foo@foo.com': 'foo', 'bar@bar.com': 'bar'}
+        self.sent = []
+        bot.send = lambda user, text: self.sent.append((user, text))
+
+        return bot
+
+
+class TestMailbox(unittest.TestCase):
+    """ Tests for the persistent mailbox. """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_should_persist_messages_until_taken(self):
+        # Given
+        Mailbox(JSONStorage(self.tempdir)).put('bar', 'foo', 'hello')
+
+        # When
+        mailbox = Mailbox(JSONStorage(self.tempdir))
+        pending = 'bar' in mailbox
+        messages = mailbox.take('bar')
+
+        # Then
+        self.assertTrue(pending)
+        self.assertEqual([('foo', 'hello')], messages)
+        self.assertNotIn('bar', Mailbox(JSONStorage(self.tempdir)))
+        self.assertEqual([], mailbox.take('bar'))
+
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
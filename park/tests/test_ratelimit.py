@@ -0,0 +1,111 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the pacing of outbound stanzas. """
+
+# Standard library
+import time
+import unittest
+
+# Project library
+from park.ratelimit import RateLimiter, TokenBucket
+
+
+class TestRateLimit(unittest.TestCase):
+    """ Tests for the pacing of outbound stanzas. """
+
+    def setUp(self):
+        self.now = 0.0
+
+    def test_should_allow_burst_upto_capacity(self):
+        # Given
+        bucket = TokenBucket(3, 1.5, clock=self._clock)
+
+        # When
+        delays = [bucket.reserve() for _ in range(4)]
+
+        # Then
+        self.assertEqual([0.0, 0.0, 0.0, 0.5], delays)
+
+        return
+
+    def test_should_refill_tokens_over_time(self):
+        # Given
+        bucket = TokenBucket(2, 1, clock=self._clock)
+        bucket.reserve()
+        bucket.reserve()
+
+        # When
+        self.now += 0.5
+        delay = bucket.reserve()
+
+        # Then
+        self.assertEqual(0.0, delay)
+        self.assertEqual(0.5, bucket.reserve())
+
+        return
+
+    def test_should_send_submitted_stanzas_in_order(self):
+        # Given
+        limiter = RateLimiter((100, 1), per_user_limit=(100, 1))
+        sent = []
+
+        # When
+        for i in range(10):
+            limiter.submit('foo@foo.com', sent.append, i)
+        limiter.flush()
+
+        # Then
+        self.assertEqual(range(10), sent)
+        self.assertEqual(10, limiter.stats['count'])
+
+        return
+
+    def test_should_not_hold_up_others_for_user_over_limit(self):
+        # Given
+        limiter = RateLimiter((100, 1), per_user_limit=(1, 60))
+        sent = []
+
+        # When
+        limiter.submit('foo@foo.com', sent.append, 'foo-1')
+        limiter.submit('foo@foo.com', sent.append, 'foo-2')
+        limiter.submit('bar@bar.com', sent.append, 'bar-1')
+        self._wait_while(lambda: len(sent) < 2)
+        time.sleep(0.1)
+
+        # Then
+        self.assertEqual(['foo-1', 'bar-1'], sent)
+        self.assertEqual(1, limiter.stats['queued'])
+
+        return
+
+    def test_should_prune_idle_user_buckets(self):
+        # Given
+        limiter = RateLimiter((100, 1), per_user_limit=(10, 0.05))
+        limiter.wait('foo@foo.com')
+
+        # When
+        time.sleep(0.1)
+        limiter.wait('bar@bar.com')
+
+        # Then
+        self.assertEqual(1, limiter.stats['user_buckets'])
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _clock(self):
+        return self.now
+
+    def _wait_while(self, condition, timeout=5):
+        started = time.time()
+        while condition() and time.time() - started < timeout:
+            time.sleep(0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
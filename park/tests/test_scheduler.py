@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the scheduler of idle hooks. """
+
+# Standard library
+import threading
+import time
+import unittest
+
+# Project library
+from park.scheduler import Scheduler, parse_interval
+
+
+class TestScheduler(unittest.TestCase):
+    """ Tests for the scheduler of idle hooks. """
+
+    def test_should_parse_aliases(self):
+        self.assertEqual(30, parse_interval(30))
+        self.assertEqual(24 * 60 * 60, parse_interval('@daily'))
+        self.assertRaises(ValueError, parse_interval, '@fortnightly')
+        self.assertRaises(ValueError, parse_interval, 0)
+
+    def test_should_run_functions_at_own_intervals(self):
+        # Given
+        scheduler = Scheduler()
+        fast, slow = [], []
+        scheduler.add(fast.append, 0.05, args=(1,), jitter=0, name='fast')
+        scheduler.add(slow.append, '@daily', args=(1,), name='slow')
+
+        # When
+        thread = self._run(scheduler)
+        time.sleep(0.5)
+        scheduler.stop()
+        thread.join(1)
+
+        # Then
+        self.assertFalse(thread.is_alive())
+        self.assertGreater(len(fast), 3)
+        self.assertEqual([1], slow)
+        self.assertEqual(1, scheduler.stats['slow']['runs'])
+
+        return
+
+    def test_should_skip_runs_while_running(self):
+        # Given
+        scheduler = Scheduler()
+        release = threading.Event()
+        started = []
+
+        def hook():
+            started.append(time.time())
+            release.wait()
+
+        scheduler.add(hook, 0.05, jitter=0)
+
+        # When
+        thread = self._run(scheduler)
+        time.sleep(0.3)
+        release.set()
+        scheduler.stop()
+        thread.join(1)
+
+        # Then
+        stats = scheduler.stats.values()[0]
+        self.assertEqual(1, len(started))
+        self.assertGreater(stats['overruns'], 0)
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _run(self, scheduler):
+        thread = threading.Thread(target=scheduler.run)
+        thread.daemon = True
+        thread.start()
+
+        return thread
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
@@ -0,0 +1,136 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the sed plugin. """
+
+# Standard library
+import time
+import unittest
+
+# Project library
+from park.plugins import sed
+from park.plugins.sed import History, Matcher
+from park.tests.utils import Bot
+from park.util import captured_stdout
+
+
+class TestSed(unittest.TestCase):
+    """ Tests for the sed plugin. """
+
+    def test_should_prefer_users_own_messages(self):
+        # Given
+        bot = Bot()
+        self._say(bot, 'foo@foo.com', 'I like cats')
+        self._say(bot, 'bar@bar.com', 'cats are lazy')
+        self._say(bot, 'bar@bar.com', 'hello')
+
+        # When
+        mine = self._say(bot, 'foo@foo.com', 's/cats/dogs/')
+        others = self._say(bot, 'baz@baz.com', 's/cats/dogs/')
+
+        # Then
+        self.assertEqual('_foo meant I like dogs_', mine)
+        self.assertEqual('_bar meant dogs are lazy_', others)
+
+        return
+
+    def test_should_report_invalid_regex(self):
+        # Given
+        bot = Bot()
+        self._say(bot, 'foo@foo.com', 'I like cats')
+
+        # When
+        output = self._say(bot, 'bar@bar.com', 's/(cats/dogs/')
+
+        # Then
+        self.assertEqual('_bar, invalid regex._', output)
+
+        return
+
+    def test_should_replace_for_members_not_in_users(self):
+        # Given
+        bot = Bot()
+        self._say(bot, 'bar@bar.com', 'I like cats')
+        del bot.users['bar@bar.com']
+
+        # When
+        left = self._say(bot, 'foo@foo.com', 's/cats/dogs/')
+        invited = self._say(bot, 'new@new.com', 's/cows/dogs/')
+
+        # Then
+        self.assertEqual('_bar@bar.com meant I like dogs_', left)
+        self.assertEqual(
+            '_new@new.com, No replacements found. May be your message is too '
+            'old_',
+            invited
+        )
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _say(self, bot, user, text):
+        with captured_stdout() as captured:
+            sed.message_processor(bot, user, text)
+
+        return captured.output.strip()
+
+
+class TestHistory(unittest.TestCase):
+    """ Tests for the ring buffer of messages. """
+
+    def test_should_drop_oldest_messages(self):
+        # Given
+        history = History(size=3)
+
+        # When
+        for i in range(5):
+            history.append('foo' if i % 2 else 'bar', str(i))
+
+        # Then
+        self.assertEqual(3, len(history))
+        self.assertEqual(
+            [('bar', '4'), ('foo', '3'), ('bar', '2')],
+            history.get_messages()
+        )
+        self.assertEqual(
+            [('bar', '4'), ('bar', '2')], history.get_messages('bar')
+        )
+        self.assertEqual([('foo', '3')], history.get_messages('foo'))
+
+        return
+
+
+class TestMatcher(unittest.TestCase):
+    """ Tests for replacing text in a worker process. """
+
+    def setUp(self):
+        self.matcher = Matcher(timeout=0.5)
+
+    def tearDown(self):
+        self.matcher.stop()
+
+    def test_should_kill_catastrophic_patterns(self):
+        # Given
+        message = 'a' * 40 + '!'
+
+        # When
+        started = time.time()
+        with self.assertRaises(RuntimeError):
+            self.matcher.replace('(a+)+$', 'b', [message])
+        duration = time.time() - started
+        result = self.matcher.replace('a+', 'b', [message])
+
+        # Then
+        self.assertLess(duration, 5)
+        self.assertEqual(1, self.matcher.timeouts)
+        self.assertEqual((0, 'b!'), result)
+
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for persisting the state of the bot. """
+
+# Standard library
+import os
+from os.path import join
+import shutil
+import tempfile
+import time
+import unittest
+
+# Project library
+from park.serialize import StateStore, read_state, save_state
+from park.storage import JSONStorage
+
+
+class TestSerialize(unittest.TestCase):
+    """ Tests for persisting the state of the bot. """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = join(self.tempdir, 'state.json')
+        self.storage = JSONStorage(self.tempdir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_should_save_atomically(self):
+        # Given
+        save_state(self.path, {'topic': 'old'})
+
+        # When
+        with self.assertRaises(TypeError):
+            save_state(self.path, {'topic': object()})
+
+        # Then
+        self.assertEqual({'topic': 'old'}, read_state(self.path))
+        self.assertEqual(['state.json'], os.listdir(self.tempdir))
+
+        return
+
+    def test_should_skip_writes_when_unchanged(self):
+        # Given
+        store = StateStore(self.storage)
+        store.update({'topic': 'parks', 'ideas': []})
+
+        # When
+        store.update({'topic': 'parks', 'ideas': []})
+        store.update({'topic': 'parks'})
+
+        # Then
+        self.assertEqual(1, store.writes)
+        self.assertEqual(
+            {'topic': 'parks', 'ideas': []}, read_state(self.path)
+        )
+
+        return
+
+    def test_should_coalesce_writes_within_delay(self):
+        # Given
+        store = StateStore(self.storage, delay=0.2)
+
+        # When
+        for i in range(10):
+            store.update({'topic': 'topic %s' % i})
+        pending = read_state(self.path)
+        time.sleep(0.5)
+
+        # Then
+        self.assertEqual({}, pending)
+        self.assertEqual({'topic': 'topic 9'}, store.read())
+        self.assertEqual({'topic': 'topic 9'}, read_state(self.path))
+        self.assertEqual(1, store.writes)
+        self.assertEqual(set(), store.dirty)
+
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the persistent queue of jobs. """
+
+# Standard library
+import shutil
+import tempfile
+import time
+import unittest
+
+# Project library
+from park.spool import DONE, FAILED, QUEUED, Rejected, Spool
+
+
+class TestSpool(unittest.TestCase):
+    """ Tests for the persistent queue of jobs. """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.handled = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_should_handle_jobs_queued_before_restart(self):
+        # Given
+        job_id = Spool(self.tempdir, self._handle).put('foo')
+
+        # When
+        spool = Spool(self.tempdir, self._handle)
+        spool.start()
+        spool.put('bar')
+        self._wait_while(lambda: len(self.handled) < 2)
+        spool.stop()
+
+        # Then
+        self.assertEqual(['foo', 'bar'], self.handled)
+        self.assertEqual(0, spool.pending)
+        self.assertEqual(DONE, spool.status(job_id)['status'])
+
+        return
+
+    def test_should_retry_with_backoff_and_give_up(self):
+        # Given
+        given_up = []
+        spool = Spool(
+            self.tempdir, self._fail, max_attempts=2, backoff=0,
+            failed=lambda item, errors: given_up.append((item, len(errors)))
+        )
+        job_id = spool.put('foo')
+
+        # When
+        spool.process()
+        status = spool.status(job_id)
+        spool.process()
+
+        # Then
+        self.assertEqual(QUEUED, status['status'])
+        self.assertEqual(FAILED, spool.status(job_id)['status'])
+        self.assertEqual(2, len(spool.status(job_id)['errors']))
+        self.assertEqual([('foo', 2)], given_up)
+
+        return
+
+    def test_should_not_retry_rejected_jobs(self):
+        # Given
+        given_up = []
+        spool = Spool(
+            self.tempdir, self._reject,
+            failed=lambda item, errors: given_up.append(item)
+        )
+        job_id = spool.put('foo')
+
+        # When
+        spool.process()
+
+        # Then
+        self.assertEqual(FAILED, spool.status(job_id)['status'])
+        self.assertEqual(1, spool.status(job_id)['attempts'])
+        self.assertEqual(['foo'], given_up)
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _fail(self, item):
+        raise ValueError(item)
+
+    def _reject(self, item):
+        raise Rejected(item)
+
+    def _handle(self, item):
+        self.handled.append(item)
+
+    def _wait_while(self, condition, timeout=5):
+        started = time.time()
+        while condition() and time.time() - started < timeout:
+            time.sleep(0.01)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
@@ -0,0 +1,106 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the storage backends. """
+
+# Standard library
+from os.path import join
+import shutil
+import tempfile
+import unittest
+
+# Project library
+from park.serialize import read_state, save_state
+from park.storage import (
+    JSONStorage, SQLITE, SQLITE_DB_NAME, SQLiteStorage, open_storage
+)
+
+
+class TestStorage(unittest.TestCase):
+    """ Tests for the storage backends. """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_should_get_set_and_delete_keys(self):
+        for storage in self._get_storages():
+            # When
+            storage.set('state', 'topic', 'parks')
+            storage.set('state', 'users', {'foo@foo.com': 'foo'})
+            storage.set('other', 'topic', 'playgrounds')
+            storage.delete('state', 'users')
+
+            # Then
+            self.assertEqual('parks', storage.get('state', 'topic'))
+            self.assertIsNone(storage.get('state', 'users'))
+            self.assertEqual([('topic', 'parks')], storage.items('state'))
+
+        return
+
+    def test_should_rollback_failed_transaction(self):
+        for storage in self._get_storages():
+            # Given
+            storage.set('state', 'topic', 'parks')
+
+            # When
+            with self.assertRaises(RuntimeError):
+                with storage.transaction():
+                    storage.set('state', 'topic', 'playgrounds')
+                    storage.set('state', 'ideas', ['swings'])
+                    raise RuntimeError
+
+            # Then
+            self.assertEqual([('topic', 'parks')], storage.items('state'))
+
+        return
+
+    def test_should_migrate_state_to_sqlite(self):
+        # Given
+        state = {'topic': 'parks', 'users': {'foo@foo.com': 'foo'}}
+        save_state(join(self.tempdir, 'state.json'), state)
+
+        # When
+        storage = open_storage(SQLITE, self.tempdir)
+        storage.set('state', 'topic', 'playgrounds')
+        storage.close()
+        storage = open_storage(SQLITE, self.tempdir)
+
+        # Then
+        self.assertEqual(
+            dict(state, topic='playgrounds'), dict(storage.items('state'))
+        )
+        self.assertEqual(state, read_state(join(self.tempdir, 'state.json')))
+
+        return
+
+    def test_should_migrate_after_interrupted_migration(self):
+        # Given
+        state = {'topic': 'parks'}
+        save_state(join(self.tempdir, 'state.json'), state)
+        SQLiteStorage(join(self.tempdir, SQLITE_DB_NAME)).close()
+
+        # When
+        storage = open_storage(SQLITE, self.tempdir)
+
+        # Then
+        self.assertEqual(state, dict(storage.items('state')))
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _get_storages(self):
+        return [
+            JSONStorage(tempfile.mkdtemp(dir=self.tempdir)),
+            SQLiteStorage(join(self.tempdir, SQLITE_DB_NAME)),
+        ]
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
@@ -0,0 +1,208 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the stories plugin. """
+
+# Standard library
+import shutil
+import tempfile
+import unittest
+
+# Project library
+from park.plugins import stories
+from park.plugins.stories import Publisher, Timeline
+from park.spool import DONE, FAILED
+from park.tests.utils import Bot, TwitterApi
+
+
+class TestPublisher(unittest.TestCase):
+    """ Tests for publishing stories in the background. """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.bot = Bot()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_should_publish_and_tell_author(self):
+        # Given
+        api = TwitterApi([])
+        publisher = Publisher(self.bot, self.tempdir, api=api)
+
+        # When
+        job_id = publisher.publish('Once upon a time', 'foo@foo.com')
+        duplicate = publisher.publish('once upon  a time', 'foo@foo.com')
+
+        # Then
+        self.assertIsNotNone(job_id)
+        self.assertIsNone(duplicate)
+        self.assertEqual(['Once upon a time'], api.posted)
+        self.assertEqual(0, publisher.spool.pending)
+        self.assertEqual(
+            [('foo@foo.com', 'wOOt! You just got published foo')],
+            self.bot.sent
+        )
+
+        return
+
+    def test_should_retry_until_twitter_recovers(self):
+        # Given
+        api = TwitterApi([], errors=[88])
+        publisher = Publisher(self.bot, self.tempdir, api=api)
+        publisher.spool.backoff = 0
+
+        # When
+        publisher.publish('Once upon a time', 'foo@foo.com')
+        pending = publisher.spool.pending
+        publisher.spool.process()
+
+        # Then
+        self.assertEqual(1, pending)
+        self.assertEqual(['Once upon a time'], api.posted)
+        self.assertEqual(1, len(self.bot.sent))
+
+        return
+
+    def test_should_tell_author_about_failures_and_allow_retelling(self):
+        # Given
+        api = TwitterApi([], errors=[186])
+        publisher = Publisher(self.bot, self.tempdir, api=api)
+
+        # When
+        job_id = publisher.publish('Once upon a time', 'foo@foo.com')
+        publisher.publish('Once upon a time', 'foo@foo.com')
+
+        # Then
+        self.assertEqual(FAILED, publisher.spool.status(job_id)['status'])
+        self.assertEqual(['Once upon a time'], api.posted)
+        self.assertEqual(2, len(self.bot.sent))
+        self.assertIn('Status is over 140 characters', self.bot.sent[0][1])
+
+        return
+
+    def test_should_not_repost_when_author_is_not_subscribed(self):
+        # Given
+        api = TwitterApi([])
+        publisher = Publisher(self.bot, self.tempdir, api=api)
+        self.bot.users = {}
+
+        # When
+        job_id = publisher.publish('Once upon a time', 'foo@foo.com')
+
+        # Then
+        self.assertEqual(DONE, publisher.spool.status(job_id)['status'])
+        self.assertEqual(['Once upon a time'], api.posted)
+        self.assertEqual(
+            [('foo@foo.com', 'wOOt! You just got published foo@foo.com')],
+            self.bot.sent
+        )
+
+        return
+
+
+    def test_should_resume_publishing_after_restart(self):
+        # Given
+        api = TwitterApi([], errors=[88])
+        publisher = Publisher(self.bot, self.tempdir, api=api)
+        publisher.spool.backoff = 0
+        publisher.publish('Once upon a time', 'foo@foo.com')
+
+        # When
+        bot = Bot()
+        bot.stories_publisher = Publisher(bot, self.tempdir, api=api)
+        stories.idle_hook(bot)
+
+        # Then
+        self.assertEqual(['Once upon a time'], api.posted)
+        self.assertEqual(0, bot.stories_publisher.spool.pending)
+        self.assertEqual(
+            [('foo@foo.com', 'wOOt! You just got published foo')], bot.sent
+        )
+
+        return
+
+
+class TestTimeline(unittest.TestCase):
+    """ Tests for the cached timeline of stories. """
+
+    def test_should_page_until_window_is_covered(self):
+        # Given
+        api = TwitterApi(range(1, 451))
+        timeline = Timeline(api)
+
+        # When
+        tweets = timeline.get_tweets_since(since_id=100)
+
+        # Then
+        self.assertEqual(range(450, 100, -1), [tweet.id for tweet in tweets])
+        self.assertEqual([None, 250, 100], [c['max_id'] for c in api.calls])
+
+        return
+
+    def test_should_not_refetch_cached_tweets(self):
+        # Given
+        api = TwitterApi(range(1, 11))
+        timeline = Timeline(api)
+        timeline.get_tweets_since(since_id=2)
+        calls = len(api.calls)
+
+        # When
+        tweets = timeline.get_tweets_since(since_id=5)
+
+        # Then
+        self.assertEqual(range(10, 5, -1), [tweet.id for tweet in tweets])
+        self.assertEqual(calls, len(api.calls))
+
+        return
+
+    def test_should_fetch_only_newer_tweets_on_refresh(self):
+        # Given
+        api = TwitterApi(range(1, 11))
+        timeline = Timeline(api, refresh_interval=0)
+        timeline.get_tweets_since(since_id=5)
+        api.ids.extend([11, 12])
+
+        # When
+        tweets = timeline.get_tweets_since(since_id=5)
+
+        # Then
+        self.assertEqual(range(12, 5, -1), [tweet.id for tweet in tweets])
+        self.assertEqual(10, api.calls[-1]['since_id'])
+
+        return
+
+    def test_should_unescape_text_of_tweets(self):
+        # Given
+        api = TwitterApi([1], text='Fish &amp; chips &lt;3 %d')
+        timeline = Timeline(api)
+
+        # When
+        tweets = timeline.get_tweets_since()
+
+        # Then
+        self.assertEqual(['Fish & chips <3 1'], [t.text for t in tweets])
+
+        return
+
+    def test_should_return_cached_tweets_on_errors(self):
+        # Given
+        api = TwitterApi(range(1, 11))
+        timeline = Timeline(api, refresh_interval=0)
+        timeline.get_tweets_since(since_id=5)
+        api.ids = None
+
+        # When
+        tweets = timeline.get_tweets_since(since_id=5)
+
+        # Then
+        self.assertEqual(5, len(tweets))
+
+        return
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
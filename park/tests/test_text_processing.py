@@ -8,7 +8,9 @@
 import unittest
 
 # Project library
-from park.text_processing import chunk_text, highlight_word, strip_tags
+from park.text_processing import (
+    NickHighlighter, chunk_text, coalesce_text, highlight_word, strip_tags
+)
 
 
 class TestTextProcessing(unittest.TestCase):
@@ -57,6 +59,18 @@ class TestTextProcessing(unittest.TestCase):
 
         return
 
+    def test_should_coalesce_messages_upto_limit(self):
+        # Given
+        limit = 7
+
+        # When
+        messages = coalesce_text(['ab', 'cd', 'ef', 'ghijklmn', 'op'], limit)
+
+        # Then
+        self.assertEqual(['ab\ncd', 'ef', 'ghijklmn', 'op'], messages)
+
+        return
+
     def test_should_highlight_exact_word(self):
         # Given
         word = 'foo'
@@ -96,6 +110,36 @@ class TestTextProcessing(unittest.TestCase):
 
         return
 
+    def test_should_highlight_all_nicks_in_one_pass(self):
+        # Given
+        highlighter = NickHighlighter(['foo', 'bar', 'baz'])
+        text = "foo's bar or foobar?"
+
+        # When
+        variants = highlighter.highlight(text)
+
+        # Then
+        self.assertEqual(variants['foo'], highlight_word(text, 'foo'))
+        self.assertEqual(variants['bar'], highlight_word(text, 'bar'))
+        self.assertNotIn('baz', variants)
+
+        return
+
+    def test_should_highlight_updated_nicks(self):
+        # Given
+        highlighter = NickHighlighter(['foo'])
+        text = 'foo.bar foo'
+
+        # When
+        highlighter.update(['foo.bar'])
+        variants = highlighter.highlight(text)
+
+        # Then
+        self.assertNotIn('foo', highlighter)
+        self.assertEqual({'foo.bar': '*foo.bar* foo'}, variants)
+
+        return
+
     def test_should_strip_tags_should_not_barf_on_plain_text(self):
         # Given
         text = 'this is plain text'
@@ -0,0 +1,274 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the urls plugin. """
+
+# Standard library
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from os.path import exists, join
+import shutil
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+import tempfile
+import threading
+import time
+import unittest
+
+# Project library
+from park.plugins import urls
+from park.plugins.urls import (
+    DB_NAME, LEGACY_DB_NAME, Digest, UrlLog, _get_email, _get_metadata,
+    _get_url_log, _normalize_url, _read_head
+)
+from park.serialize import save_state
+from park.tests.utils import Bot
+
+
+class TestUrls(unittest.TestCase):
+    """ Tests for the urls plugin. """
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.path = join(self.tempdir, DB_NAME)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_should_stream_entries_from_offset(self):
+        # Given
+        url_log = UrlLog(self.path)
+        url_log.append([{'url': 'http://a.com'}, {'url': 'http://b.com'}])
+        url_log.append([{'url': 'http://c.com'}])
+
+        # When
+        entries = list(UrlLog(self.path).read(1))
+
+        # Then
+        self.assertEqual(3, len(url_log))
+        self.assertEqual(
+            [{'url': 'http://b.com'}, {'url': 'http://c.com'}], entries
+        )
+
+        return
+
+    def test_should_truncate_partially_written_entry(self):
+        # Given
+        UrlLog(self.path).append([{'url': 'http://a.com'}])
+        with open(self.path, 'a') as f:
+            f.write('{"url": "http://b')
+
+        # When
+        url_log = UrlLog(self.path)
+        url_log.append([{'url': 'http://c.com'}])
+
+        # Then
+        self.assertEqual(
+            [{'url': 'http://a.com'}, {'url': 'http://c.com'}], list(url_log)
+        )
+
+        return
+
+    def test_should_move_legacy_db_to_log(self):
+        # Given
+        bot = Bot(self.tempdir)
+        legacy_path = join(self.tempdir, LEGACY_DB_NAME)
+        save_state(legacy_path, [{'url': 'http://a.com'}])
+
+        # When
+        url_log = _get_url_log(bot)
+
+        # Then
+        self.assertFalse(exists(legacy_path))
+        self.assertEqual([{'url': 'http://a.com'}], list(url_log))
+
+        return
+
+    def test_should_build_digest_incrementally(self):
+        # Given
+        bot = Bot(self.tempdir)
+        url_log = UrlLog(self.path)
+        url_log.append([self._entry('http://a.com/')])
+        digest = Digest(url_log)
+
+        # When
+        digest.add([self._entry('http://A.com'), self._entry('http://b.com')])
+        digest.add([
+            self._entry('https://github.com/punchagan/childrens-park/pull/1')
+        ])
+        archived = digest.archive(join(self.tempdir, 'archive.jsonl'))
+        digest.add([self._entry('http://c.com')])
+
+        # Then
+        context = archived.get_context(bot)
+        self.assertEqual(
+            ['http://a.com/', 'http://b.com'],
+            [entry['url'] for entry in context['shared_links']]
+        )
+        self.assertEqual(1, len(context['code_updates']))
+        self.assertEqual('foo', context['shared_links'][0]['name'])
+        self.assertEqual(4, len(archived.url_log))
+        self.assertEqual(1, len(digest))
+        self.assertEqual(1, len(UrlLog(self.path)))
+
+        return
+
+    def test_should_cache_and_revalidate_metadata(self):
+        # Given
+        bot = Bot(self.tempdir)
+        server = self._start_server()
+        url = 'http://127.0.0.1:%s/page#top' % server.server_port
+
+        # When
+        first = _get_metadata(bot, url)
+        second = _get_metadata(bot, url.upper().replace('PAGE#TOP', 'page'))
+        bot.url_cache.set(_normalize_url(url), first, ttl=-1)
+        third = _get_metadata(bot, url)
+
+        # Then
+        self.assertEqual('Parks', first['title'])
+        self.assertEqual(first, second)
+        self.assertEqual(first, third)
+        self.assertEqual([None, '"v1"'], server.requests)
+        self.assertEqual((1, 2), (bot.url_cache.hits, bot.url_cache.misses))
+
+        return
+
+    def test_should_fetch_urls_concurrently_within_deadline(self):
+        # Given
+        bot = Bot(self.tempdir)
+        server = self._start_server()
+        base = 'http://127.0.0.1:%s/' % server.server_port
+        pages = [base + 'slow', base + 'page', base + 'slow?again']
+        self._patch(urls, 'MESSAGE_DEADLINE', 0.5)
+
+        # When
+        started = time.time()
+        urls.message_processor(bot, 'foo@foo.com', ' '.join(pages))
+        duration = time.time() - started
+
+        # Then
+        entries = list(_get_url_log(bot))
+        self.assertLess(duration, 1)
+        self.assertEqual(pages, [entry['url'] for entry in entries])
+        self.assertEqual(
+            [pages[0], 'Parks', pages[2]],
+            [entry['title'] for entry in entries]
+        )
+        self.assertEqual('', entries[0]['description'])
+
+        return
+
+    def test_should_render_non_ascii_titles(self):
+        # Given
+        bot = Bot(self.tempdir)
+        server = self._start_server()
+        url = 'http://127.0.0.1:%s/cafe' % server.server_port
+
+        # When
+        urls.message_processor(bot, 'foo@foo.com', url)
+        digest = urls._archive_db(bot)
+        body = _get_email(bot, digest, 'Parkly', {'stories': []})
+
+        # Then
+        self.assertIn(u'Caf\xe9 \u2013 News', body)
+        self.assertIn(u'Caf\xe9 au lait', body)
+
+        return
+
+    def test_should_read_only_head_of_html_pages(self):
+        # Given
+        head = '<html><head><title>Parks</title></HEAD>'
+        page = StringIO(head + '<body>' + 'x' * 10 ** 6 + '</body></html>')
+        bot = Bot(self.tempdir)
+        server = self._start_server()
+        pdf = 'http://127.0.0.1:%s/pdf' % server.server_port
+
+        # When
+        data = _read_head(page, 64 * 1024)
+        metadata = _get_metadata(bot, pdf)
+
+        # Then
+        self.assertTrue(data.startswith(head))
+        self.assertLessEqual(len(data), 8192)
+        self.assertEqual('', metadata['title'])
+        self.assertIn(_normalize_url(pdf), bot.url_cache)
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _entry(self, url):
+        return {
+            'url': url, 'title': '', 'description': '', 'user': 'foo@foo.com',
+            'timestamp': '2014-07-01T10:00:00'
+        }
+
+    def _patch(self, obj, name, value):
+        self.addCleanup(setattr, obj, name, getattr(obj, name))
+        setattr(obj, name, value)
+
+    def _start_server(self):
+        server = _Server(('127.0.0.1', 0), _Handler)
+        server.requests = []
+        thread = threading.Thread(target=server.serve_forever)
+        thread.daemon = True
+        thread.start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+
+        return server
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """ Serves a page with an ETag, and supports conditional requests. """
+
+    def do_GET(self):
+        if self.path.startswith('/slow'):
+            time.sleep(1)
+
+        etag = self.headers.get('If-None-Match')
+        self.server.requests.append(etag)
+
+        if self.path == '/pdf':
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/pdf')
+            self.end_headers()
+            self.wfile.write('%PDF <title>Not a page</title>')
+
+        elif self.path == '/cafe':
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.end_headers()
+            self.wfile.write(
+                '<html><head><meta charset="utf-8">'
+                '<title>Caf\xc3\xa9 \xe2\x80\x93 News</title>'
+                '<meta name="description" content="Caf\xc3\xa9 au lait">'
+                '</head></html>'
+            )
+
+        elif etag == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+
+        else:
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html')
+            self.send_header('ETag', '"v1"')
+            self.end_headers()
+            self.wfile.write('<html><head><title>Parks</title></head></html>')
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    """ An HTTP server handling each request in a thread. """
+
+    daemon_threads = True
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
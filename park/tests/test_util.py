@@ -6,14 +6,103 @@
 
 # Standard library
 import base64
-from os.path import abspath, dirname
+import os
+from os.path import abspath, dirname, join
+import shutil
+import sys
+import tempfile
+import threading
 
 # Project library
-from park.util import send_email
+from park.plugins.stories import Timeline
+from park.tests.utils import TwitterApi
+from park.util import captured_stdout, render_template, send_email
 
 HERE = dirname(abspath(__file__))
 
 
+def test_should_capture_output_per_thread():
+    # Given
+    outputs = {}
+    foo_capturing, bar_printed = threading.Event(), threading.Event()
+
+    def foo():
+        with captured_stdout(local=True) as captured:
+            foo_capturing.set()
+            bar_printed.wait()
+            print 'foo'
+        outputs['foo'] = captured.output
+
+    def bar():
+        foo_capturing.wait()
+        with captured_stdout(local=True) as captured:
+            print 'bar'
+        bar_printed.set()
+        outputs['bar'] = captured.output
+
+    # When
+    threads = [threading.Thread(target=target) for target in (foo, bar)]
+    [thread.start() for thread in threads]
+    [thread.join() for thread in threads]
+
+    # Then
+    assert outputs == {'foo': 'foo\n', 'bar': 'bar\n'}
+
+    return
+
+
+def test_should_capture_output_of_other_threads():
+    # Given
+    stdout = sys.stdout
+
+    def say_hello():
+        print 'hello'
+
+    # When
+    with captured_stdout() as captured:
+        thread = threading.Thread(target=say_hello)
+        thread.start()
+        thread.join()
+
+    # Then
+    assert captured.output == 'hello\n'
+    assert sys.stdout is stdout
+
+    return
+
+
+def test_should_render_template_with_inlined_css():
+    # Given
+    tempdir = tempfile.mkdtemp()
+    path = join(tempdir, 'template.html')
+    with open(path, 'w') as f:
+        f.write(
+            '<html><head><style>a {color: red}</style></head><body>'
+            '{% for url in urls %}<a href="{{url}}">{{url}}</a>{% endfor %}'
+            '<p>{{story}}</p></body></html>'
+        )
+    timeline = Timeline(TwitterApi([1], text='Fish &amp; chips %d'))
+    story = timeline.get_tweets_since()[0].text
+
+    # When
+    output = render_template(
+        path, {'urls': ['/a?b&c'], 'story': story}, inline_css=True
+    )
+    render_template(path, {'urls': []})
+    with open(path, 'w') as f:
+        f.write('{{ urls[0] }}')
+    os.utime(path, (0, 0))
+    changed = render_template(path, {'urls': ['/a?b&c']})
+    shutil.rmtree(tempdir)
+
+    # Then
+    assert '<a href="/a?b&amp;c" style="color:red">/a?b&amp;c</a>' in output
+    assert '<p>Fish &amp; chips 1</p>' in output
+    assert '/a?b&c' == changed
+
+    return
+
+
 def test_send_html_email():
     # Given
     body = """<html><body> foo </body></html>"""
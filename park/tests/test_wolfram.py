@@ -0,0 +1,108 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Tests for the wolfram plugin. """
+
+# Standard library
+import threading
+import unittest
+
+# Project library
+from park.plugins.wolfram import MAX_PODS, Wolfram
+
+
+class TestWolfram(unittest.TestCase):
+    """ Tests for answering queries with Wolfram Alpha. """
+
+    def setUp(self):
+        self.answers = []
+
+    def test_should_share_requests_and_cache_answers(self):
+        # Given
+        client = _Client([_Pod('Input', 'pi'), _Pod('Result', '3.14')])
+        wolfram = Wolfram(client, self._answered)
+        client.release.clear()
+
+        # When
+        job = wolfram.ask('pi', 'foo')
+        shared = wolfram.ask('PI ', 'bar')
+        client.release.set()
+        job.wait(5)
+        cached = wolfram.ask('pi', 'baz')
+
+        # Then
+        self.assertIs(job, shared)
+        self.assertIsNone(cached)
+        self.assertEqual(1, client.queries)
+        self.assertEqual(
+            [
+                ('pi', [('Result', '3.14')], ['foo', 'bar']),
+                ('pi', [('Result', '3.14')], ['baz']),
+            ],
+            self.answers
+        )
+
+        return
+
+    def test_should_cap_pods_and_not_cache_errors(self):
+        # Given
+        client = _Client([_Pod('Pod%d' % i, str(i)) for i in range(10)])
+        wolfram = Wolfram(client, self._answered)
+
+        # When
+        wolfram.ask('numbers', 'foo').wait(5)
+        client.pods = None
+        wolfram.ask('error', 'foo').wait(5)
+        wolfram.ask('error', 'foo').wait(5)
+
+        # Then
+        self.assertEqual(MAX_PODS, len(self.answers[0][1]))
+        self.assertEqual(
+            [None, None], [pods for _, pods, _ in self.answers[1:]]
+        )
+        self.assertEqual(3, client.queries)
+
+        return
+
+    #### Private protocol #####################################################
+
+    def _answered(self, query, pods, users):
+        self.answers.append((query, pods, users))
+
+
+class _Client(object):
+    """ A Wolfram Alpha client, that answers with the given pods. """
+
+    def __init__(self, pods):
+        self.pods = pods
+        self.queries = 0
+        self.release = threading.Event()
+        self.release.set()
+
+    def query(self, query):
+        self.release.wait(5)
+        self.queries += 1
+        if self.pods is None:
+            raise IOError('Could not connect')
+
+        return _Result(self.pods)
+
+
+class _Pod(object):
+
+    def __init__(self, title, text):
+        self.id = self.title = title
+        self.text = text
+
+
+class _Result(object):
+
+    def __init__(self, pods):
+        self.pods = iter(pods)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+#### EOF ######################################################################
@@ -0,0 +1,78 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+# Copyright (c) 2014 Puneeth Chaganti <punchagan@muse-amuse.in>
+""" Stand-ins shared by the tests of the plugins. """
+
+# Standard library
+import threading
+
+# 3rd party library
+import twitter
+
+# Project library
+from park.storage import JSONStorage
+
+
+class Bot(object):
+    """ A stand-in for the bot, with only what the plugins need.
+
+    The messages sent to users are recorded in ``sent``, and a storage is
+    created in ``root``, if one is given.
+
+    """
+
+    def __init__(self, root=None):
+        self.debug = True
+        self.root = root
+        self.lock = threading.RLock()
+        self.storage = JSONStorage(root) if root is not None else None
+        self.users = {
+            'foo@foo.com': 'foo', 'bar@bar.com': 'bar', 'baz@baz.com': 'baz'
+        }
+        self.invited = {}
+        self.sent = []
+
+    def send(self, user, text):
+        self.sent.append((user, text))
+
+
+class TwitterApi(object):
+    """ A twitter client, with a timeline of tweets with the given ids.
+
+    Posting fails with the given error codes, one per post, in order.
+
+    """
+
+    def __init__(self, ids, errors=(), text='story %d'):
+        self.ids = list(ids)
+        self.text = text
+        self.calls = []
+        self.errors = list(errors)
+        self.posted = []
+
+    def GetUserTimeline(self, since_id=None, max_id=None, count=200, **kw):
+        self.calls.append(dict(since_id=since_id, max_id=max_id))
+        ids = [
+            id_ for id_ in reversed(self.ids)
+            if id_ > (since_id or 0) and (max_id is None or id_ <= max_id)
+        ]
+
+        return [
+            twitter.Status(
+                id=id_, text=self.text % id_,
+                created_at='Mon Jul 07 10:00:00 +0000 2014'
+            )
+            for id_ in ids[:count]
+        ]
+
+    def PostUpdate(self, status):
+        if len(self.errors) > 0:
+            code = self.errors.pop(0)
+            raise twitter.TwitterError(
+                [{'code': code, 'message': 'Status is over 140 characters'}]
+            )
+
+        self.posted.append(status)
+
+#### EOF ######################################################################
@@ -31,6 +31,26 @@ def chunk_text(text, limit=512, messages=None):
     return messages[::-1]
 
 
+def coalesce_text(messages, limit=512):
+    """ Pack consecutive messages into as few messages as possible.
+
+    Messages are joined with newlines, as long as the joined message is not
+    longer than limit.  Messages longer than the limit are left as they are.
+
+    """
+
+    packed = []
+
+    for message in messages:
+        if packed and len(packed[-1]) + 1 + len(message) <= limit:
+            packed[-1] = '%s\n%s' % (packed[-1], message)
+
+        else:
+            packed.append(message)
+
+    return packed
+
+
 def highlight_word(text, word):
     """ Highlights the given word in the given text string. """
 
@@ -39,6 +59,64 @@ def highlight_word(text, word):
     return re.sub("(\W|\A)(%s)(\W|\Z)" % nick, "\\1*\\2*\\3", text)
 
 
+class NickHighlighter(object):
+    """ Highlights the nicks of all the users in a text, in a single pass.
+
+    The index of nicks is rebuilt only when :meth:`update` is called, and
+    :meth:`highlight` returns the highlighted variant of the text for each
+    nick that appears in it.
+
+    """
+
+    def __init__(self, nicks=()):
+        self.update(nicks)
+
+    def __contains__(self, nick):
+        return nick in self._nicks
+
+    def highlight(self, text):
+        """ Return a dict of nick -> text with the nick highlighted.
+
+        Nicks which don't appear in the text are not in the dict.
+
+        """
+
+        if self._pattern is None:
+            return {}
+
+        spans = {}
+        for match in self._pattern.finditer(text):
+            spans.setdefault(match.group(1), []).append(match.span(1))
+
+        variants = {}
+        for nick, positions in spans.iteritems():
+            parts, last = [], 0
+            for start, end in positions:
+                parts.extend([text[last:start], '*', text[start:end], '*'])
+                last = end
+            parts.append(text[last:])
+            variants[nick] = ''.join(parts)
+
+        return variants
+
+    def update(self, nicks):
+        """ Rebuild the index for the given nicks. """
+
+        nicks = frozenset(nick for nick in nicks if nick)
+
+        # Longer nicks first, so that a nick isn't shadowed by its prefix.
+        alternatives = '|'.join(
+            re.escape(nick) for nick in sorted(nicks, key=len, reverse=True)
+        )
+        pattern = (
+            re.compile(r'(?<!\w)(%s)(?!\w)' % alternatives) if nicks else None
+        )
+
+        self._nicks, self._pattern = nicks, pattern
+
+        return
+
+
 def strip_tags(html):
     """ Strip out the tags from given html. """
 
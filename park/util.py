@@ -13,14 +13,18 @@ from functools import wraps
 import json
 import logging
 from logging.handlers import TimedRotatingFileHandler
+from os.path import abspath, basename, dirname, getmtime, join
+import re
 from StringIO import StringIO
-import smtplib
 import sys
+import threading
+import time
 from urlparse import urlparse
 from urllib2 import unquote, urlopen, HTTPError
 
 # 3rd party library
 from jinja2 import Template
+from premailer import transform
 
 # Project library
 try:
@@ -30,25 +34,49 @@ except ImportError as e:
     logger.error('No email settings found. Cannot send email.')
     EMAIL_DOMAIN, EMAIL_FROM, EMAIL_PASSWORD, EMAIL_USER = [''] * 4
 
+# Emails sent in (messages, seconds), to stay within the limits of the server
+try:
+    from park.settings import EMAIL_RATE_LIMIT
+except ImportError:
+    EMAIL_RATE_LIMIT = (20, 60)
+
+# Emails are queued in this directory, and sent in the background
+try:
+    from park.settings import MAIL_SPOOL_DIR
+except ImportError:
+    MAIL_SPOOL_DIR = join(dirname(abspath(__file__)), 'spool', 'mail')
+
+from park.mail import MailTransport
+from park.spool import Spool
 from park.text_processing import strip_tags
 
 
 class captured_stdout(object):
-    """ A context manager to capture anything written to stdout. """
+    """ A context manager to capture anything written to stdout.
+
+    Writes are captured per thread: ``sys.stdout`` is replaced with a proxy
+    that sends the writes of a thread to the innermost capture entered by
+    that thread.  Writes from threads that are not capturing their output
+    go to the innermost capture that was entered with ``local=False`` (in
+    any thread), or to the real stdout if there is no such capture.
+
+    """
+
+    def __init__(self, local=False):
+        self.local = local
 
     #### 'contextmanager' protocol ############################################
 
     def __enter__(self):
         self.stream = StringIO()
         self._output = None
-        self.old = sys.stdout
-        sys.stdout = self.stream
+        self._proxy = _ThreadLocalStdout.push(self.stream, self.local)
 
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self._output = self.stream.getvalue()
-        sys.stdout = self.old
+        self._proxy.pop(self.stream, self.local)
 
     #### 'captured_stdout' protocol ###########################################
 
@@ -128,13 +156,23 @@ def google(query):
     return result
 
 
-def render_template(path, context):
-    """  Render the given template using the given context. """
+def render_template(path, context, inline_css=False):
+    """  Render the given template using the given context.
+
+    Templates are compiled once, and compiled again only when the file
+    changes.  With ``inline_css``, CSS is inlined into the template itself,
+    rather than into each rendered document.
+
+    """
 
-    with open(path) as f:
-        template = Template(f.read())
+    started = time.time()
+    template = _get_template(path, inline_css)
+    output = template.render(**context)
+    logging.getLogger(__name__).info(
+        'Rendered %s in %.3fs', basename(path), time.time() - started
+    )
 
-    return template.render(**context)
+    return output
 
 
 def requires_invite(f):
@@ -153,7 +191,7 @@ def requires_invite(f):
         if name is not None:
             self.log.info('%s called %s with %s' % (user, name, args[1:]))
 
-        if user not in self.users and user not in self.invited:
+        if user not in self.members:
             message = 'You atleast need to be invited!'
 
         else:
@@ -176,7 +214,7 @@ def requires_subscription(f):
         if name is not None:
             self.log.info('%s called %s with %s' % (user, name, args[1:]))
 
-        if user not in self.users:
+        if not self.members.is_subscribed(user):
             message = (
                 'You are not subscribed! Use %s to subscribe' %
                 self.subscribe._jabberbot_command_name
@@ -190,8 +228,29 @@ def requires_subscription(f):
     return wrapper
 
 
+def get_mail_spool():
+    """ Return the spool of emails to send, starting it if required. """
+
+    global _MAIL_SPOOL
+
+    with _MAIL_LOCK:
+        if _MAIL_SPOOL is None:
+            _MAIL_SPOOL = Spool(MAIL_SPOOL_DIR, _deliver_email, 'mail-spool')
+            _MAIL_SPOOL.start()
+
+    return _MAIL_SPOOL
+
+
 def send_email(to, subject, body, typ_='text', debug=False):
-    """ Send an email. """
+    """ Queue an email to be sent, and return the message.
+
+    When sending to a list of addresses, each recipient gets a message of
+    their own, so that they don't see each other's addresses.  The messages
+    are saved to the mail spool, and sent in the background over one reused
+    SMTP connection, retrying on errors.  When debugging, the message is
+    printed instead.
+
+    """
 
     if typ_ == 'text':
         msg = MIMEText(body, _charset='utf-8')
@@ -201,22 +260,202 @@ def send_email(to, subject, body, typ_='text', debug=False):
         msg.attach(MIMEText(strip_tags(body), 'plain', _charset='utf-8'))
         msg.attach(MIMEText(body, 'html', _charset='utf-8'))
 
-    msg['To'] = ', '.join(to) if isinstance(to, list) else to
+    recipients = to if isinstance(to, list) else [to]
+    msg['To'] = ', '.join(recipients)
     msg['From'] = EMAIL_FROM
     msg['Subject'] = subject
 
     if not debug:
-        s = smtplib.SMTP()
-        s.connect(EMAIL_DOMAIN)
-        s.ehlo()
-        s.starttls()
-        s.login(EMAIL_USER, base64.decodestring(EMAIL_PASSWORD))
-        s.sendmail(EMAIL_FROM, to, msg.as_string())
-        s.quit()
+        spool = get_mail_spool()
+        for recipient in recipients:
+            del msg['To']
+            msg['To'] = recipient
+            spool.put({
+                'sender': EMAIL_FROM,
+                'recipients': [recipient],
+                'message': msg.as_string(),
+            })
 
     else:
         print msg.as_string()
 
     return msg
 
+#### Private protocol #########################################################
+
+_MAIL_SPOOL = None
+_MAIL_TRANSPORT = None
+_MAIL_LOCK = threading.Lock()
+
+
+def _deliver_email(email):
+    """ Send an email saved in the spool. """
+
+    _get_mail_transport().send(
+        email['sender'], email['recipients'], email['message']
+    )
+
+    return
+
+
+def _get_mail_transport():
+    """ Return the transport for sending emails, creating it if required. """
+
+    global _MAIL_TRANSPORT
+
+    with _MAIL_LOCK:
+        if _MAIL_TRANSPORT is None:
+            _MAIL_TRANSPORT = MailTransport(
+                EMAIL_DOMAIN, user=EMAIL_USER,
+                password=base64.decodestring(EMAIL_PASSWORD),
+                limit=EMAIL_RATE_LIMIT
+            )
+
+    return _MAIL_TRANSPORT
+
+
+# Compiled templates, by path and inline_css: (mtime, template)
+_TEMPLATES = {}
+_TEMPLATES_LOCK = threading.Lock()
+
+_TEMPLATE_TAG = re.compile(r'{{.*?}}|{%.*?%}', re.DOTALL)
+
+
+def _get_template(path, inline_css):
+    """ Return the compiled template, compiling it if the file changed. """
+
+    key = (path, inline_css)
+    mtime = getmtime(path)
+
+    with _TEMPLATES_LOCK:
+        cached = _TEMPLATES.get(key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        with open(path) as f:
+            source = f.read()
+
+        # Rendered documents are not parsed again to inline the CSS, so
+        # values need to be escaped while rendering.
+        if inline_css:
+            source = _inline_css(source)
+
+        template = Template(source, autoescape=inline_css)
+        _TEMPLATES[key] = (mtime, template)
+
+    return template
+
+
+def _inline_css(source):
+    """ Inline the CSS of an html template, keeping the template tags. """
+
+    tags = []
+
+    def protect(match):
+        tags.append(match.group(0))
+        return '__template_tag_%d__' % (len(tags) - 1)
+
+    html = transform(_TEMPLATE_TAG.sub(protect, source))
+
+    return re.sub(
+        r'__template_tag_(\d+)__', lambda match: tags[int(match.group(1))],
+        html
+    )
+
+
+class _ThreadLocalStdout(object):
+    """ A stdout proxy, that sends writes to a buffer of the writing thread.
+
+    """
+
+    #: Lock for installing/uninstalling the proxy, and the shared captures.
+    _lock = threading.RLock()
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._active = 0
+        self._local = threading.local()
+        self._shared = []
+
+    def __getattr__(self, name):
+        return getattr(self._target(), name)
+
+    @property
+    def softspace(self):
+        """ Used by the print statement; kept on the target stream. """
+
+        return getattr(self._target(), 'softspace', 0)
+
+    @softspace.setter
+    def softspace(self, value):
+        try:
+            self._target().softspace = value
+
+        except AttributeError:
+            pass
+
+    def flush(self):
+        self._target().flush()
+
+    def write(self, text):
+        self._target().write(text)
+
+    def writelines(self, lines):
+        self._target().writelines(lines)
+
+    #### Private protocol #####################################################
+
+    def pop(self, buffer, local):
+        """ Stop capturing into the buffer, and uninstall the proxy if unused.
+
+        """
+
+        with self._lock:
+            self._local.stack.remove(buffer)
+            if not local:
+                self._shared.remove(buffer)
+
+            self._active -= 1
+            if self._active == 0 and sys.stdout is self:
+                sys.stdout = self.stream
+
+        return
+
+    @classmethod
+    def push(cls, buffer, local):
+        """ Capture the writes of the current thread into the given buffer.
+
+        Returns the installed proxy.
+
+        """
+
+        with cls._lock:
+            if not isinstance(sys.stdout, cls):
+                sys.stdout = cls(sys.stdout)
+
+            proxy = sys.stdout
+            if getattr(proxy._local, 'stack', None) is None:
+                proxy._local.stack = []
+
+            proxy._local.stack.append(buffer)
+            if not local:
+                proxy._shared.append(buffer)
+
+            proxy._active += 1
+
+        return proxy
+
+    def _target(self):
+        """ Return the stream that the current thread should write to. """
+
+        stack = getattr(self._local, 'stack', None)
+        if stack:
+            return stack[-1]
+
+        shared = self._shared
+        if shared:
+            return shared[-1]
+
+        return self.stream
+
 #### EOF ######################################################################
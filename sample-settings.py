@@ -1,3 +1,41 @@
 USERNAME = 'foo@gmail.com'
 PASSWORD = 'bar-bar-bar'
 RES = 'my chat bot'
+
+# Number of threads used to send out broadcast messages
+FANOUT_WORKERS = 2
+
+# Maximum number of queued messages, and what to do when the queue is full:
+# 'block', 'drop-oldest' or 'drop-low-priority'.  'block' can't wait in the
+# thread that runs the commands (it also empties the queue), and drops their
+# messages right away.
+MESSAGE_QUEUE_SIZE = 1000
+MESSAGE_QUEUE_POLICY = 'drop-low-priority'
+
+# Outbound stanzas are limited to (stanzas, seconds), for all users together
+# and, optionally, for each user.
+RATE_LIMIT = (45, 12.5)
+RATE_LIMIT_PER_USER = None
+
+# Number of threads for each plugin hook, and overrides for particular hooks
+HOOK_POOL_SIZE = 2
+HOOK_POOL_SIZES = {'urls.message_processor': 4}
+
+# Seconds between saves of the bot's state
+STATE_FLUSH_INTERVAL = 60
+
+# Changes to the state are written to disk at most these many seconds later
+STATE_SAVE_DELAY = 5
+
+# Seconds between compactions of the journal of changes into the state file
+JOURNAL_COMPACT_INTERVAL = 3600
+
+# Storage backend for the state and plugin data, 'json' or 'sqlite'.  The
+# state is migrated from state.json, when the SQLite database is created.
+STORAGE_BACKEND = 'json'
+
+# Emails sent in (messages, seconds), to stay within the limits of the server
+EMAIL_RATE_LIMIT = (20, 60)
+
+# Outgoing emails are queued in this directory (park/spool/mail by default)
+# MAIL_SPOOL_DIR = '/var/spool/park/mail'